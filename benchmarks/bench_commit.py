@@ -0,0 +1,74 @@
+"""Parallel commit benchmark.
+
+Commits a change to every file of a tree with `Commit.commit`,
+creating the file objects serially and with a pool of workers,
+and checks that both commits store the same objects.
+
+Usage: python benchmarks/bench_commit.py [files] [lines] [jobs]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box.commit import Commit
+from box.tracker import Tracker
+
+
+def bench_commit(files: int, lines: int, jobs: int) -> tuple:
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+    os.makedirs(os.path.join('.box', 'objects'))
+
+    try:
+        filepaths = [f'file{number}.txt' for number in range(files)]
+
+        for filepath in filepaths:
+            with open(filepath, 'w') as file:
+                file.writelines(f'{filepath} line {line}\n' for line in range(lines))
+
+        tracker = Tracker()
+        tracker.track(filepaths)
+
+        with tracker.session():
+            Commit(tracker).commit('bench', 'bench@mail', filepaths, 'first')
+
+        # change every tenth line, so each file is diffed
+        for filepath in filepaths:
+            with open(filepath, 'w') as file:
+                file.writelines(f'{filepath} line {line}{" changed" * (line % 10 == 0)}\n' for line in range(lines))
+
+        with tracker.session():
+            commit = Commit(tracker)
+            start = time.perf_counter()
+            commit_id = commit.commit('bench', 'bench@mail', filepaths, 'second', jobs=jobs)
+            elapsed = time.perf_counter() - start
+
+        return elapsed, commit.get_commits()[commit_id]['objects']
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    jobs = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+
+    serial_time, serial_objects = bench_commit(files, lines, 1)
+    parallel_time, parallel_objects = bench_commit(files, lines, jobs)
+
+    assert serial_objects == parallel_objects, 'different objects stored'
+
+    print(f'{files} changed files of {lines} lines')
+    print(f'{"jobs":>6} {"commit (s)":>11}')
+    print(f'{1:>6} {serial_time:>11.3f}')
+    print(f'{jobs:>6} {parallel_time:>11.3f} ({serial_time / parallel_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Object compression benchmark.
+
+Commits a synthetic tree with every compression codec and
+measures commit and merge (diff) throughput and the size of
+the stored objects.
+
+Usage: python benchmarks/bench_compression.py [files] [file lines]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box.commit import Commit
+from box.objects import ObjectStore
+from box.tracker import Tracker
+
+
+def write_tree(files: int, lines: int, version: int) -> list:
+    filelist = []
+
+    for i in range(files):
+        filepath = os.path.join('tree', f'module{i}.py')
+        with open(filepath, 'w') as file:
+            for number in range(lines):
+                changed = ' # changed' if version and number % 20 == version else ''
+                file.write(f'    value_{number} = compute(data[{number}], factor={i}){changed}\n')
+
+        filelist.append(filepath)
+
+    return filelist
+
+
+def bench_codec(codec: str, files: int, lines: int) -> tuple:
+    os.makedirs(os.path.join('.box', 'objects'))
+    os.makedirs('tree')
+
+    with open(os.path.join('.box', 'config.json'), 'w') as config:
+        json.dump({'compression': codec, 'cache_size': 0}, config)
+
+    filelist = write_tree(files, lines, 0)
+    Tracker().track(filelist)
+    commit = Commit()
+
+    start = time.perf_counter()
+    commit.commit('author', 'email', filelist, 'first commit')
+
+    for version in range(1, 4):
+        write_tree(files, lines, version)
+        commit.commit('author', 'email', filelist, f'commit {version}')
+
+    commit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for filepath in filelist:
+        commit.merge_objects(filepath)
+
+    merge_time = time.perf_counter() - start
+    stats = ObjectStore().get_stats()
+
+    shutil.rmtree('.box')
+    shutil.rmtree('tree')
+
+    return commit_time, merge_time, stats
+
+
+def main() -> None:
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+
+    try:
+        print(f'{files} files of {lines} lines, 4 commits\n')
+        print(f'{"codec":>6} {"commits/s":>10} {"files merged/s":>15} {"stored":>10} {"raw":>10} {"ratio":>6}')
+
+        for codec in ('none', 'zlib', 'lzma'):
+            commit_time, merge_time, stats = bench_codec(codec, files, lines)
+            ratio = stats['size'] / stats['raw_size']
+
+            print(f'{codec:>6} {4 / commit_time:>10.2f} {files / merge_time:>15.1f} '
+                  f'{stats["size"] // 1024:>7} KiB {stats["raw_size"] // 1024:>6} KiB {ratio:>6.2f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
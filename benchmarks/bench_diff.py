@@ -0,0 +1,84 @@
+"""Line difference benchmark.
+
+Compares the positional line maps of `utils.difference_lines`
+with the hunks of `diff.diff_lines` on common edits to a
+source file, measuring the stored object size and diff time.
+
+Usage: python benchmarks/bench_diff.py [file lines]
+"""
+
+import os
+import sys
+import time
+import random
+import marshal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box import diff
+from box import utils
+
+
+def bench(func, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for __ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def make_source(lines: int) -> list:
+    source = []
+    for number in range(lines):
+        if number % 20 == 0:
+            source.append(f'def function_{number}(value):\n')
+        elif number % 20 == 19:
+            source.append('\n')
+        else:
+            source.append(f'    value = value * {number} + {number % 7}  # step {number}\n')
+    return source
+
+
+def get_edits(source: list) -> dict:
+    random.seed(0)
+    size = len(source)
+    scattered = list(source)
+
+    for number in random.sample(range(size), size // 100):
+        scattered[number] = f'    value = 0  # edited line {number}\n'
+
+    block = source[size // 4:size // 4 + 50]
+
+    return {
+        'insert at top': ['import os\n'] + source,
+        'append at end': source + ['# end of file\n'],
+        'delete block': source[:size // 2] + source[size // 2 + 50:],
+        'scattered 1%': scattered,
+        'move block': source[:size // 4] + source[size // 4 + 50:] + block,
+        'rewrite half': source[:size // 2] + [line.upper() for line in source[size // 2:]],
+    }
+
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    source = make_source(lines)
+    enum_source = utils.enumerate_lines(source)
+
+    print(f'{"edit":>14} {"positional (B)":>15} {"hunks (B)":>10} {"positional (ms)":>16} {"hunks (ms)":>11}')
+
+    for name, new_lines in get_edits(source).items():
+        enum_new = utils.enumerate_lines(new_lines)
+        positional = utils.difference_lines(enum_source, enum_new)
+        hunks = diff.diff_lines(source, new_lines)
+        assert diff.patch_lines(source, hunks) == new_lines, 'hunks do not rebuild the file'
+
+        positional_size = len(marshal.dumps(positional))
+        hunks_size = len(marshal.dumps({'hunks': hunks}))
+        positional_time = bench(lambda: utils.difference_lines(enum_source, utils.enumerate_lines(new_lines)))
+        hunks_time = bench(lambda: diff.diff_lines(source, new_lines))
+
+        print(f'{name:>14} {positional_size:>15} {hunks_size:>10} '
+              f'{positional_time * 1000:>16.2f} {hunks_time * 1000:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
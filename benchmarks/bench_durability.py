@@ -0,0 +1,75 @@
+"""Commit durability benchmark.
+
+Commits changed files with each durability mode ("full", "batch"
+and "none") and measures the commit latency. Syncing depends on
+the file system, so run it in the directory of a real repository
+(a tmpfs `/tmp` makes all modes equivalent).
+
+Usage: python benchmarks/bench_durability.py [files] [commits] [directory]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box import _config
+from box.commit import Commit
+from box.tracker import Tracker
+
+
+def bench_mode(durability: str, files: int, commits: int) -> list:
+    os.makedirs(os.path.join('.box', 'objects'))
+    _config.set_repo_config(durability=durability)
+
+    filepaths = [f'file{number}.txt' for number in range(files)]
+
+    for filepath in filepaths:
+        with open(filepath, 'w') as file:
+            file.write(f'{filepath}\n' * 50)
+
+    tracker = Tracker()
+    tracker.track(filepaths)
+    latencies = []
+
+    for number in range(commits):
+        for filepath in filepaths:
+            with open(filepath, 'a') as file:
+                file.write(f'change {number}\n')
+
+        with tracker.session():
+            commit = Commit(tracker)
+            start = time.perf_counter()
+            commit.commit('bench', 'bench@mail', filepaths, f'commit {number}')
+            latencies.append(time.perf_counter() - start)
+
+    shutil.rmtree('.box')
+    return latencies
+
+
+def main() -> None:
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    directory = sys.argv[3] if len(sys.argv) > 3 else None
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-', dir=directory)
+    os.chdir(workdir)
+
+    try:
+        print(f'{commits} commits of {files} changed files in {workdir}')
+        print(f'{"durability":>10} {"median (ms)":>12} {"max (ms)":>10}')
+
+        for durability in ('full', 'batch', 'none'):
+            latencies = bench_mode(durability, files, commits)
+            print(f'{durability:>10} {statistics.median(latencies) * 1000:>12.1f} {max(latencies) * 1000:>10.1f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
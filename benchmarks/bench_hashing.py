@@ -0,0 +1,92 @@
+"""Parallel hashing benchmark.
+
+Creates a synthetic tree and measures how `Tracker.track`
+and `Index.file_hashes` scale with the number of workers.
+
+Usage: python benchmarks/bench_hashing.py [files] [file size in KiB] [max jobs]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box.index import Index
+from box.tracker import Tracker
+
+
+def create_tree(files: int, size: int) -> list:
+    filelist = []
+
+    for i in range(files):
+        directory = os.path.join('tree', f'dir{i % 32}')
+        os.makedirs(directory, exist_ok=True)
+        filepath = os.path.join(directory, f'file{i}.txt')
+
+        with open(filepath, 'w') as file:
+            line = f'line of file {i}\n'
+            file.write(line * (size // len(line)))
+
+        filelist.append(filepath)
+
+    return filelist
+
+
+def bench(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = (int(sys.argv[2]) if len(sys.argv) > 2 else 256) * 1024
+    max_jobs = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+    os.makedirs(os.path.join('.box', 'objects'))
+
+    try:
+        filelist = create_tree(files, size)
+        print(f'{files} files of {size // 1024} KiB, {os.cpu_count()} CPUs\n')
+        print(f'{"jobs":>5} {"track (s)":>10} {"speedup":>8} {"hashes (s)":>11} {"speedup":>8}')
+
+        jobs_list = [1]
+        while jobs_list[-1] * 2 <= max_jobs:
+            jobs_list.append(jobs_list[-1] * 2)
+
+        serial_tracked = None
+        serial_hashes = None
+        base_track = base_hash = None
+
+        for jobs in jobs_list:
+            tracker = Tracker()
+            if os.path.isfile(os.path.join('.box', 'tracker.json')):
+                os.remove(os.path.join('.box', 'tracker.json'))
+
+            track_time = bench(lambda: tracker.track(filelist, jobs))
+            tracked = tracker.get_tracked()
+
+            hashes = {}
+            hash_time = bench(lambda: hashes.update(Index().file_hashes(filelist, jobs=jobs)))
+
+            if serial_tracked is None:
+                serial_tracked, serial_hashes = tracked, hashes
+                base_track, base_hash = track_time, hash_time
+
+            assert tracked == serial_tracked, 'parallel tracking differs from serial'
+            assert hashes == serial_hashes, 'parallel hashes differ from serial'
+
+            print(f'{jobs:>5} {track_time:>10.3f} {base_track / track_time:>7.2f}x '
+                  f'{hash_time:>11.3f} {base_hash / hash_time:>7.2f}x')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
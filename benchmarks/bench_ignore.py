@@ -0,0 +1,92 @@
+"""Ignored files benchmark.
+
+Creates a tree with a large ignored directory, like `node_modules`,
+and measures the time to list the non-ignored files with the
+previous implementation (substring test of absolute paths, without
+pruning) and with `ignore.get_non_ignored`.
+
+Usage: python benchmarks/bench_ignore.py [ignored files] [files]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box import ignore
+
+PATTERNS = ['node_modules', 'build/', '*.pyc', '*.log']
+
+
+def legacy_get_non_ignored(patterns: list) -> list:
+    ignored = [p if p.startswith('*') else os.path.abspath(p.lstrip('/')) for p in patterns]
+    ignored.append('.box')
+
+    def has_ignored(filepath: str) -> bool:
+        return any(i in os.path.abspath(filepath) for i in ignored)
+
+    non_ignored = []
+
+    for root, __, files in os.walk('.'):
+        if not has_ignored(root):
+            for file in files:
+                filepath = os.path.join(root, file)
+                if not has_ignored(filepath):
+                    non_ignored.append(filepath.replace('./', ''))
+
+    ignore_with = [i.replace('*', '') for i in ignored if i.startswith('*')]
+    return [f for f in non_ignored if not any(f.endswith(a) for a in ignore_with)]
+
+
+def create_tree(ignored_files: int, files: int) -> None:
+    for number in range(ignored_files):
+        dirpath = os.path.join('node_modules', f'package{number // 100}', 'lib')
+        os.makedirs(dirpath, exist_ok=True)
+        open(os.path.join(dirpath, f'module{number}.js'), 'w').close()
+
+    for number in range(files):
+        dirpath = os.path.join('src', f'module{number // 50}')
+        os.makedirs(dirpath, exist_ok=True)
+        open(os.path.join(dirpath, f'file{number}.py'), 'w').close()
+
+        if number % 10 == 0:
+            open(os.path.join(dirpath, f'file{number}.pyc'), 'w').close()
+
+
+def main() -> None:
+    ignored_files = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+
+    try:
+        create_tree(ignored_files, files)
+
+        with open(ignore.IGNORE_FILE, 'w') as ignore_file:
+            ignore_file.write('\n'.join(PATTERNS))
+
+        start = time.perf_counter()
+        legacy = legacy_get_non_ignored(PATTERNS)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        non_ignored = ignore.get_non_ignored()
+        matcher_time = time.perf_counter() - start
+
+        assert sorted(legacy) == sorted(non_ignored), 'different files listed'
+
+        print(f'{ignored_files} ignored files, {len(non_ignored)} listed files')
+        print(f'{"implementation":>16} {"time (ms)":>10}')
+        print(f'{"substring":>16} {legacy_time * 1000:>10.1f}')
+        print(f'{"matcher":>16} {matcher_time * 1000:>10.1f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Commit log query benchmark.
+
+Writes a commit log and measures the time to read the newest
+commits, all commits and commits found by author and date with
+`Commit.find_commits`, as `box log` does.
+
+Usage: python benchmarks/bench_log.py [commits]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box.commit import Commit
+from box.journal import CommitLog
+from box.history import CommitIndex
+
+
+def bench(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+    os.makedirs(os.path.join('.box', 'objects'))
+
+    try:
+        commit_log = CommitLog()
+        authors = ['ana', 'bob', 'carol', 'dave']
+
+        for number in range(commits):
+            day = date(2023, 1, 1) + timedelta(days=number * 365 // commits)
+            commit_log.append(f'{number:040x}', dict(
+                author=authors[number % len(authors)],
+                author_email=f'{authors[number % len(authors)]}@mail',
+                message=f'commit {number}',
+                date=f'{day} 12:00:00',
+                objects={'file.txt': f'{number:040x}'}
+            ))
+
+        # the index is written by commits, queries only read it
+        index_time = bench(lambda: CommitIndex().update(commit_log))
+        commit = Commit()
+
+        print(f'{commits} commits (index built in {index_time:.3f}s)')
+        print(f'{"query":>28} {"time (ms)":>10}')
+
+        queries = {
+            'newest 10': lambda: list(commit.find_commits(limit=10)),
+            'skip 1000, newest 10': lambda: list(commit.find_commits(skip=1000, limit=10)),
+            'author, newest 10': lambda: list(commit.find_commits(author='bob', limit=10)),
+            'date range': lambda: list(commit.find_commits(since='2023-03-01', until='2023-03-07')),
+            'all commits': lambda: list(commit.find_commits()),
+        }
+
+        for name, query in queries.items():
+            print(f'{name:>28} {bench(query) * 1000:>10.2f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""File reconstruction benchmark.
+
+Commits small changes to a text file and measures the time to
+reconstruct it with `Commit.merge_objects` as the history grows,
+starting from the last snapshot and replaying the whole history.
+
+Usage: python benchmarks/bench_snapshots.py [commits] [file lines]
+"""
+
+import os
+import json
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box.commit import Commit
+from box.tracker import Tracker
+
+
+def bench(func, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for __ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+    os.chdir(workdir)
+    os.makedirs(os.path.join('.box', 'objects'))
+
+    # disable the merge cache to measure the reconstruction itself
+    with open(os.path.join('.box', 'config.json'), 'w') as config:
+        json.dump({'cache_size': 0}, config)
+
+    filepath = 'file.txt'
+    content = [f'line {i}\n' for i in range(lines)]
+
+    try:
+        with open(filepath, 'w') as file:
+            file.writelines(content)
+
+        tracker = Tracker()
+        tracker.track([filepath])
+        commit = Commit()
+
+        checkpoints = set(int(commits * p / 10) for p in range(1, 11))
+        print(f'{"commits":>8} {"snapshot (ms)":>14} {"full replay (ms)":>17}')
+
+        for number in range(1, commits + 1):
+            content[number % lines] = f'line {number % lines} changed in commit {number}\n'
+
+            with open(filepath, 'w') as file:
+                file.writelines(content)
+
+            commit.commit('author', 'email', [filepath], f'commit {number}')
+
+            if number in checkpoints:
+                snapshot = tracker.get_tracked()[filepath]['snapshot']
+                merged = commit.merge_objects(filepath, snapshot)
+                assert merged == commit.merge_objects(filepath, 0), 'snapshot merge differs from full replay'
+
+                snapshot_time = bench(lambda: commit.merge_objects(filepath, snapshot))
+                replay_time = bench(lambda: commit.merge_objects(filepath, 0))
+                print(f'{number:>8} {snapshot_time * 1000:>14.2f} {replay_time * 1000:>17.2f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""CLI startup benchmark.
+
+Measures the time from interpreter start to exit of each
+command on repositories with an empty and a long history,
+showing that commands that do not read the history stay fast.
+
+Usage: python benchmarks/bench_startup.py [commits]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_PATH)
+
+from box.journal import CommitLog
+from box.tracker import Tracker
+
+COMMANDS = (
+    ['--version'],
+    ['init'],
+    ['config', '--jobs', '1'],
+    ['status'],
+    ['log'],
+)
+
+
+def create_repo(repo_path: str, commits: int) -> None:
+    os.makedirs(os.path.join(repo_path, '.box', 'objects'))
+    cwd = os.getcwd()
+    os.chdir(repo_path)
+
+    with open('file.txt', 'w') as file:
+        file.write('content\n')
+
+    Tracker().track(['file.txt'])
+    CommitLog().write_all({
+        f'{number:040x}': dict(
+            author='author',
+            author_email='email',
+            message=f'commit {number}',
+            date='2023-06-11 10:00:00',
+            objects={'file.txt': f'{number:040x}'}
+        ) for number in range(commits)
+    })
+
+    os.chdir(cwd)
+
+
+def run_command(repo_path: str, command: list, repeat: int = 5) -> float:
+    env = dict(os.environ, PYTHONPATH=PACKAGE_PATH, HOME=repo_path)
+    args = [sys.executable, '-c', 'from box.__main__ import main; main()', *command]
+    start = time.perf_counter()
+
+    for __ in range(repeat):
+        subprocess.run(args, cwd=repo_path, env=env, stdout=subprocess.DEVNULL)
+
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    workdir = tempfile.mkdtemp(prefix='box-bench-')
+
+    try:
+        empty_repo = os.path.join(workdir, 'empty')
+        large_repo = os.path.join(workdir, 'large')
+        create_repo(empty_repo, 0)
+        create_repo(large_repo, commits)
+
+        print(f'{"command":<20} {"0 commits (ms)":>15} {f"{commits} commits (ms)":>20}')
+
+        for command in COMMANDS:
+            empty_time = run_command(empty_repo, command)
+            large_time = run_command(large_repo, command)
+            print(f'{" ".join(command):<20} {empty_time * 1000:>15.1f} {large_time * 1000:>20.1f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
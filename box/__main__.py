@@ -16,52 +16,110 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import sys
+import json
 import time
 from os import path, makedirs
 from typing import Union
+from functools import lru_cache
 
 from argeasy import ArgEasy
 
 from . import _config
 from . import exceptions
-from . import utils
-from .tracker import Tracker
-from .commit import Commit
-from .filter import Filter
+from .diff import diff_lines
+from .objects import ObjectStore, CODECS
+from .atomic import DURABILITY_MODES
+from .lock import RepositoryLock, DEFAULT_LOCK_TIMEOUT
 from .__init__ import __version__
-from .ignore import get_non_ignored
+from .ignore import Scan, scan
+from .utils import SYSCALLS, count_syscalls
 
 REPO_PATH = '.box'
 OBJECTS_PATH = path.join(REPO_PATH, 'objects')
 
-tracker = Tracker()
-commit = Commit()
 
+# repository state is loaded on first use, so commands that
+# do not need it (like "init", "config" and "--version") stay fast
 
-def _get_uncommitted_files(tracked: dict) -> tuple:
+@lru_cache(maxsize=None)
+def _get_tracker():
+    from .tracker import Tracker
+    return Tracker()
+
+
+@lru_cache(maxsize=None)
+def _get_commit():
+    from .commit import Commit
+    return Commit(_get_tracker())
+
+
+@lru_cache(maxsize=None)
+def _get_index():
+    from .index import Index
+    return Index()
+
+
+def _get_jobs(jobs: str = None) -> int:
+    if jobs is None:
+        return _config.get_repo_config().get('jobs', 1)
+
+    try:
+        jobs = int(jobs)
+        if jobs < 0:
+            raise ValueError
+    except ValueError:
+        print(f'\033[1;31mInvalid number of jobs: {repr(jobs)}\033[m')
+        print('\033[33mUse "--jobs" with a positive number, or 0 to use all CPUs\033[m')
+        sys.exit(1)
+
+    return jobs
+
+
+def _get_number(value: str, flag: str) -> int:
+    try:
+        number = int(value)
+        if number < 0:
+            raise ValueError
+    except ValueError:
+        print(f'\033[1;31mInvalid value for "{flag}": {repr(value)}\033[m')
+        print(f'\033[33mUse "{flag}" with a positive number\033[m')
+        sys.exit(1)
+
+    return number
+
+
+def _get_file_hashes(tracked: dict, files: Scan = None, jobs: int = 1) -> dict:
+    # stat results of the scan are reused, so scanned files are not stat'ed again
+    stats = {filepath: files.stat(filepath) for filepath in tracked if filepath in files} if files else None
+    hashes = _get_index().file_hashes(list(tracked), stats, jobs)
+    _get_index().save(tracked)
+    return hashes
+
+
+def _get_uncommitted_files(tracked: dict, hashes: dict) -> tuple:
     uncommitted = [filepath for filepath, info in tracked.items() if not info['committed']]
-    changed_files = [filepath for filepath, info in tracked.items() if info['hash'] != tracker.get_file_hash(filepath)]
+    changed_files = [filepath for filepath, info in tracked.items() if info['hash'] != hashes[filepath]]
     return (*uncommitted, *changed_files)
 
 
-def _get_untracked_files(non_ignored: list, tracked: dict) -> tuple:
-    tracked_dirs = [path.dirname(f) for f in tracked]
-    non_ignored_filtered = []
-    dirs = []
+def _get_untracked_files(non_ignored: list, tracked: dict, collapse_dirs: bool = True) -> tuple:
+    if not collapse_dirs:
+        return tuple(file for file in non_ignored if file not in tracked)
+
+    tracked_dirs = {path.dirname(f) for f in tracked}
 
-    for fp in non_ignored:
-        _dir = path.dirname(fp)
-        if (_dir and _dir != './') and _dir not in dirs:
-            if not _dir in tracked_dirs:
-                dirs.append(_dir)
+    # a directory without tracked files is listed instead of its
+    # files, in the order it is found (dict keys keep the order)
+    untracked_dirs = {}
+    untracked_files = []
 
     for file in non_ignored:
-        dirname = path.dirname(file)
-        if dirname not in dirs:
-            non_ignored_filtered.append(file)
-        
-    untracked_files = [file for file in non_ignored_filtered if file not in tracked]
-    untracked_dirs = [_dir + '/' for _dir in dirs]
+        _dir = path.dirname(file)
+
+        if _dir and _dir not in tracked_dirs:
+            untracked_dirs[_dir + '/'] = None
+        elif file not in tracked:
+            untracked_files.append(file)
 
     return *untracked_dirs, *untracked_files
 
@@ -75,26 +133,30 @@ def _init() -> None:
         print(f'\033[32mNew repository started in {repr(REPO_PATH)}\033[m')
 
 
-def _add(files: Union[list, str]) -> None:
+def _add(files: Union[list, str], jobs: int = 1) -> None:
     if files == "*":
-        non_ignored = get_non_ignored()
-        tracked = tracker.get_tracked()
-        files = _get_untracked_files(non_ignored, tracked)
+        scanned = scan()
+        tracked = _get_tracker().get_tracked()
+        files = _get_untracked_files(list(scanned), tracked, collapse_dirs=False)
+        # files of the scan are known to exist, without a stat
+        exists = scanned.__contains__
+    else:
+        exists = path.isfile
 
     for file in files:
-        if not path.isfile(file):
+        if not exists(file):
             print(f'\033[31mFile {repr(file)} not exists in current directory\033[m')
             sys.exit(1)
 
-    tracker.track(files)
+    _get_tracker().track(files, jobs)
 
 
-def _status() -> None:
-    non_ignored = get_non_ignored()
-    tracked_files = tracker.get_tracked()
+def _status(jobs: int = 1) -> None:
+    files = scan()
+    tracked_files = _get_tracker().get_tracked()
 
-    uncommitted = _get_uncommitted_files(tracked_files)
-    untracked = _get_untracked_files(non_ignored, tracked_files)
+    uncommitted = _get_uncommitted_files(tracked_files, _get_file_hashes(tracked_files, files, jobs))
+    untracked = _get_untracked_files(list(files), tracked_files)
 
     if uncommitted or untracked:
         print('\033[1mUncommitted files\033[m')
@@ -121,7 +183,7 @@ def _status() -> None:
         print('\033[33m0 files found for track or commit\033[m')
 
 
-def _commit(files: Union[list, str], message: str) -> None:
+def _commit(files: Union[list, str], message: str, jobs: int = 1) -> None:
     author = _config.get_author()
     author_name = author.get('name')
     author_email = author.get('email')
@@ -137,13 +199,14 @@ def _commit(files: Union[list, str], message: str) -> None:
         print('\033[33mUse "-m" flag and insert a message to commit\033[m')
         sys.exit(1)
 
-    tracked = tracker.get_tracked()
-    uncommitted = _get_uncommitted_files(tracked)
+    tracked = _get_tracker().get_tracked()
+    hashes = _get_file_hashes(tracked, jobs=jobs)
+    uncommitted = _get_uncommitted_files(tracked, hashes)
 
     try:
         if files == "*":
             time_s = time.time()
-            commit_id = commit.commit(author_name, author_email, uncommitted, message)
+            commit_id = _get_commit().commit(author_name, author_email, uncommitted, message, hashes, jobs)
             files = uncommitted
         else:
             for file in files:
@@ -156,7 +219,7 @@ def _commit(files: Union[list, str], message: str) -> None:
                     sys.exit(1)
 
             time_s = time.time()
-            commit_id = commit.commit(author_name, author_email, files, message)
+            commit_id = _get_commit().commit(author_name, author_email, files, message, jobs=jobs)
 
         print(f'Commit #\033[4m{commit_id[:7]}\033[m "{message}"')
         print(f'\033[33m{len(files)} files committed in {time.time() - time_s:.3f}s\033[m')
@@ -165,15 +228,27 @@ def _commit(files: Union[list, str], message: str) -> None:
         print('\033[33mYou can only commit changed and tracked files\033[m')
 
 
-def _log(by_name: str = None, by_email: str = None, by_date: str = None) -> None:
-    _filter = Filter()
+def _log(by_name: str = None, by_email: str = None, by_date: str = None,
+         since: str = None, until: str = None, filepath: str = None,
+         skip: int = 0, limit: int = None, json_lines: bool = False) -> None:
+    if filepath:
+        filepath = path.normpath(filepath)
 
-    commits = commit.get_commits()
-    commits = reversed(commits.items())
-    filtered_commits = _filter.filter(dict(commits), by_name=by_name,
-                                      by_email=by_email, by_date=by_date)
+    try:
+        commits = _get_commit().find_commits(by_name, by_email, by_date, since, until, filepath, skip, limit)
+    except exceptions.InvalidDateError as error:
+        print(f'\033[1;31m{error}\033[m')
+        print('\033[33mUse dates in the format "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"\033[m')
+        sys.exit(1)
 
-    for cid, cdata in filtered_commits.items():
+    # commits are read from the log as they are printed
+    if json_lines:
+        for cid, cdata in commits:
+            print(json.dumps(dict(id=cid, **cdata)))
+
+        return
+
+    for cid, cdata in commits:
         author_email = cdata['author_email']
         files = len(cdata['objects'])
         message = cdata['message']
@@ -185,37 +260,221 @@ def _log(by_name: str = None, by_email: str = None, by_date: str = None) -> None
 
 
 def _diff() -> None:
-    tracked = tracker.get_tracked()
+    tracked = _get_tracker().get_tracked()
 
     for file, info in tracked.items():
         if not info['binary']:
             with open(file, 'r') as reader:
                 content = reader.readlines()
 
-            merged = commit.merge_objects(file)
-            current_lines = utils.enumerate_lines(content)
-            diff = utils.difference_lines(merged, current_lines)
-            
-            if diff:
+            merged = _get_commit().merge_objects(file, info.get('snapshot', 0))
+            hunks = diff_lines(merged, content)
+
+            if hunks:
+                changed = sum(deleted + len(inserted) for __, deleted, inserted in hunks)
                 print(f'\033[1mfile {repr(file)} diff\033[m')
-                print(f'\033[33m{len(diff)} lines changed\n\033[m')
+                print(f'\033[33m{changed} lines changed\n\033[m')
+
+                # line numbers of inserted lines refer to the current file
+                offset = 0
 
-                for number, line in diff.items():
-                    if line is None:
+                for start, deleted, inserted in hunks:
+                    for number in range(start, start + deleted):
                         print(f'    \033[31m{number} | -- {merged[number]}\033[m')
-                    else:
+
+                    for number, line in enumerate(inserted, start + offset):
                         print(f'    \033[32m{number} | ++ {line}\033[m')
 
+                    offset += len(inserted) - deleted
+
                 print()
 
 
 def _integrity():
-    if commit.check_integrity():
+    if _get_commit().check_integrity():
         print('\033[1;32mCommits without external changes\033[m')
     else:
         print('\033[1;31mSome commits were changed inappropriately\033[m')
 
-    print(f'\033[33m{len(commit.get_commits())} commits checked\033[m')
+    print(f'\033[33m{_get_commit().get_commits_count()} commits checked\033[m')
+
+
+def _audit(jobs: int):
+    report = _get_commit().audit(jobs)
+
+    if report.valid:
+        print('\033[1;32mCommits without external changes\033[m')
+    else:
+        print('\033[1;31mSome commits were changed inappropriately\033[m')
+        print(f'    First broken commit: \033[34;4m{report.broken_commit[:7]}\033[m')
+
+        if report.broken_object:
+            print(f'    Changed object: \033[34;4m{report.broken_object}\033[m')
+        else:
+            print('    Commit data was changed')
+
+    print(f'\033[33m{report.commits} commits and {report.objects} objects '
+          f'({_format_size(report.size)}) checked in {report.elapsed:.3f}s\033[m')
+    print(f'\033[33m{report.mb_per_second:.1f} MB/s, {report.commits_per_second:.0f} commits/s\033[m')
+
+
+def _format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+
+    return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+
+def _stats() -> None:
+    stats = ObjectStore(OBJECTS_PATH).get_stats()
+    saved = stats['raw_size'] - stats['size']
+    ratio = saved / stats['raw_size'] * 100 if stats['raw_size'] else 0
+    compression = _config.get_repo_config().get('compression', 'none')
+
+    print(f'\033[1m{stats["objects"]} objects\033[m ({stats["packed"]} packed, compression: {compression})')
+    print(f'    Stored size: {_format_size(stats["size"])}')
+    print(f'    Uncompressed size: {_format_size(stats["raw_size"])}')
+    print(f'\033[32m    Space saved: {_format_size(saved)} ({ratio:.1f}%)\033[m')
+
+
+def _gc() -> None:
+    packed = ObjectStore(OBJECTS_PATH).pack()
+    print(f'\033[1;32m{packed} loose objects packed\033[m')
+
+
+def _migrate() -> None:
+    if _get_commit().convert_commit_file():
+        print('\033[33mCommits converted to the append-only commit log\033[m')
+
+    migrated = _get_commit().migrate_objects()
+    print(f'\033[1;32mRepository storage is up to date\033[m')
+    print(f'\033[33m{migrated} objects migrated to content-addressed storage\033[m')
+
+
+def _print_syscalls() -> None:
+    print(f'\033[1m{sum(SYSCALLS.values())} file system calls\033[m')
+
+    for name, count in SYSCALLS.most_common():
+        print(f'    {name}: {count}')
+
+
+def _dispatch(args) -> None:
+    if args.init:
+        _init()
+    elif args.add is not None:
+        with _get_tracker().session():
+            if args.a:
+                _add('*', _get_jobs(args.jobs))
+            else:
+                _add(args.add, _get_jobs(args.jobs))
+    elif args.status:
+        with _get_tracker().session():
+            _status(_get_jobs(args.jobs))
+    elif args.log is not None:
+        if len(args.log) > 1:
+            print('\033[1;31mThe "log" command accepts only one file\033[m')
+            print('\033[33mUse "log" or "log <filename>"\033[m')
+            sys.exit(1)
+
+        filepath = args.log[0] if args.log else None
+        limit = args.n if args.n is not None else args.limit
+        limit = _get_number(limit, '--limit') if limit is not None else None
+        skip = _get_number(args.skip, '--skip') if args.skip is not None else 0
+
+        _log(args.filter_by_name, args.filter_by_email, args.filter_by_date,
+             args.since, args.until, filepath, skip, limit, args.json)
+    elif args.commit is not None:
+        if args.am and len(args.commit) > 0:
+            print(f'\033[1;31mThe "commit" command must not contain arguments when "-am" is present.\033[m')
+            print('\033[33mUse "commit <filename> -m" or "commit -am"\033[m')
+        elif args.am:
+            with _get_tracker().session():
+                _commit('*', args.am, _get_jobs(args.jobs))
+        else:
+            with _get_tracker().session():
+                _commit(args.commit, args.m, _get_jobs(args.jobs))
+    elif args.diff:
+        with _get_tracker().session():
+            _diff()
+    elif args.integrity:
+        if args.full:
+            _audit(_get_jobs(args.jobs))
+        else:
+            _integrity()
+    elif args.migrate:
+        _migrate()
+    elif args.stats:
+        _stats()
+    elif args.gc:
+        _gc()
+    elif args.config:
+        name, email = args.name, args.email
+        repo_options = {}
+
+        if args.jobs is not None:
+            repo_options['jobs'] = _get_jobs(args.jobs)
+
+        if args.compression is not None:
+            if args.compression not in CODECS:
+                print(f'\033[1;31mUnknown compression codec: {repr(args.compression)}\033[m')
+                print(f'\033[33mAvailable codecs: {", ".join(CODECS)}\033[m')
+                sys.exit(1)
+
+            repo_options['compression'] = args.compression
+
+        if args.durability is not None:
+            if args.durability not in DURABILITY_MODES:
+                print(f'\033[1;31mUnknown durability mode: {repr(args.durability)}\033[m')
+                print(f'\033[33mAvailable modes: {", ".join(DURABILITY_MODES)}\033[m')
+                sys.exit(1)
+
+            repo_options['durability'] = args.durability
+
+        if repo_options and not path.isdir(REPO_PATH):
+            print('\033[1;31mRepository not found\033[m')
+            print('\033[33mRepository options can only be set inside a repository\033[m')
+            sys.exit(1)
+
+        if name or email:
+            _config.set_author(name, email)
+
+        if repo_options:
+            _config.set_repo_config(**repo_options)
+
+        if not any((name, email, repo_options)):
+            print('\033[1;31mName, email or a repository option is required\033[m')
+            print('\033[33mUse "--name", "--email", "--jobs", "--compression" or "--durability" flag\033[m')
+
+
+def _run(args) -> None:
+    if not path.isdir(OBJECTS_PATH) and not any((args.init, args.config)):
+        print('\033[1;31mRepository not found\033[m')
+        print('\033[33mCreate a repository with "init" command\033[m')
+        sys.exit(1)
+
+    if args.init or args.config:
+        _dispatch(args)
+        return
+
+    # commands that change the repository hold the lock alone. Other
+    # commands share it: they only replace caches atomically, and read
+    # commits past the commit and file indexes without writing them
+    exclusive = any((args.add is not None, args.commit is not None, args.migrate, args.gc))
+    lock = RepositoryLock(REPO_PATH, _config.get_repo_config().get('lock_timeout', DEFAULT_LOCK_TIMEOUT))
+
+    try:
+        lock.acquire(exclusive)
+    except exceptions.LockTimeoutError as error:
+        print(f'\033[1;31m{error}\033[m')
+        print('\033[33mAnother command is using the repository, try again later\033[m')
+        sys.exit(1)
+
+    try:
+        _dispatch(args)
+    finally:
+        lock.release()
 
 
 def main() -> None:
@@ -227,10 +486,13 @@ def main() -> None:
 
     parser.add_argument('init', 'Init a empty repository', action='store_true')
     parser.add_argument('status', 'View uncommitted and untracked files', action='store_true')
-    parser.add_argument('log', 'View commits log', action='store_true')
+    parser.add_argument('log', 'View commits log, or the commits of a file', action='append')
     parser.add_argument('diff', 'Get difference of files', action='store_true')
     parser.add_argument('integrity', 'Check commits integrity', action='store_true')
     parser.add_argument('config', 'Global config', action='store_true')
+    parser.add_argument('migrate', 'Upgrade the repository storage format', action='store_true')
+    parser.add_argument('stats', 'View objects storage statistics', action='store_true')
+    parser.add_argument('gc', 'Pack loose objects into a new pack file', action='store_true')
     parser.add_argument('add', 'Add new files to track list', action='append')
     parser.add_argument('commit', 'Commit files', action='append')
 
@@ -240,45 +502,30 @@ def main() -> None:
 
     parser.add_flag('--name', 'Set author name')
     parser.add_flag('--email', 'Set author email')
+    parser.add_flag('--full', 'Check the integrity of all commits in parallel, ignoring the last check', action='store_true')
+    parser.add_flag('--jobs', 'Number of processes used to hash files and create commit objects (0 to use all CPUs)')
+    parser.add_flag('--compression', f'Set the compression of new objects ({", ".join(CODECS)})')
+    parser.add_flag('--durability', f'Set when written files are synced to disk ({", ".join(DURABILITY_MODES)})')
 
     parser.add_flag('--filter-by-name', 'Filter log commit by author name')
     parser.add_flag('--filter-by-date', 'Filter log commit by date (format "YYYY-MM-DD")')
     parser.add_flag('--filter-by-email', 'Filter log commit by author email')
+    parser.add_flag('--since', 'Show commits from a date (format "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS")')
+    parser.add_flag('--until', 'Show commits until a date (format "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS")')
+    parser.add_flag('-n', 'Show only a number of commits')
+    parser.add_flag('--limit', 'Show only a number of commits')
+    parser.add_flag('--skip', 'Skip a number of commits before showing commits')
+    parser.add_flag('--json', 'Show log commits as JSON lines', action='store_true')
+    parser.add_flag('--debug', 'Show the number of file system calls of the command', action='store_true')
 
     args = parser.parse()
 
-    if not path.isdir(OBJECTS_PATH) and not any((args.init, args.config)):
-        print('\033[1;31mRepository not found\033[m')
-        print('\033[33mCreate a repository with "init" command\033[m')
-        sys.exit(1)
+    if not args.debug:
+        _run(args)
+        return
 
-    if args.init:
-        _init()
-    elif args.add is not None:
-        if args.a:
-            _add('*')
-        else:
-            _add(args.add)
-    elif args.status:
-        _status()
-    elif args.log:
-        _log(args.filter_by_name, args.filter_by_email, args.filter_by_date)
-    elif args.commit is not None:
-        if args.am and len(args.commit) > 0:
-            print(f'\033[1;31mThe "commit" command must not contain arguments when "-am" is present.\033[m')
-            print('\033[33mUse "commit <filename> -m" or "commit -am"\033[m')
-        elif args.am:
-            _commit('*', args.am)
-        else:
-            _commit(args.commit, args.m)
-    elif args.diff:
-        _diff()
-    elif args.integrity:
-        _integrity()
-    elif args.config:
-        name, email = args.name, args.email
-        if name or email:
-            _config.set_author(name, email)
-        else:
-            print('\033[1;31mName or email is required\033[m')
-            print('\033[33mUse "--name" or "--email" flag\033[m')
+    try:
+        with count_syscalls():
+            _run(args)
+    finally:
+        _print_syscalls()
@@ -1,9 +1,11 @@
 import os
 import json
-import pathlib
 
-HOME_PATH = pathlib.Path.home()
+from .atomic import atomic_write, DURABILITY_MODES, DEFAULT_DURABILITY
+
+HOME_PATH = os.path.expanduser('~')
 BOX_CONFIG_PATH = os.path.join(HOME_PATH, '.box.config.json')
+REPO_CONFIG_PATH = os.path.join('.box', 'config.json')
 
 
 def get_author() -> dict:
@@ -25,5 +27,26 @@ def set_author(name: str = None, email: str = None) -> None:
     if email:
         author_info['email'] = email
 
-    with open(BOX_CONFIG_PATH, 'w') as file:
-        json.dump({'author': author_info}, file, indent=2)
+    atomic_write(BOX_CONFIG_PATH, json.dumps({'author': author_info}, indent=2))
+
+
+def get_repo_config() -> dict:
+    try:
+        with open(REPO_CONFIG_PATH, 'r') as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        return {}
+    else:
+        return config
+
+
+def set_repo_config(**options) -> None:
+    config = get_repo_config()
+    config.update(options)
+
+    atomic_write(REPO_CONFIG_PATH, json.dumps(config, indent=2))
+
+
+def get_durability() -> str:
+    durability = get_repo_config().get('durability', DEFAULT_DURABILITY)
+    return durability if durability in DURABILITY_MODES else DEFAULT_DURABILITY
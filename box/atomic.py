@@ -0,0 +1,185 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+from os import path
+
+# "full" syncs every file when it is written, "batch" syncs
+# the files of a command together and "none" never syncs
+DURABILITY_MODES = ('full', 'batch', 'none')
+DEFAULT_DURABILITY = 'batch'
+
+
+def get_temp_path(filepath: str) -> str:
+    # unique by process, so concurrent writers do not share temporary files
+    return f'{filepath}.{os.getpid()}.tmp'
+
+
+def fsync_file(filepath: str) -> None:
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(dirpath: str) -> None:
+    """Sync a directory, making renames and new files
+    in the directory durable.
+
+    :param dirpath: Directory path, `""` for the current directory
+    """
+
+    # directories can not be opened on Windows
+    if os.name != 'nt':
+        fsync_file(dirpath or '.')
+
+
+def atomic_write(filepath: str, data, durability: str = 'full') -> None:
+    """Write a file atomically.
+
+    The data is written to a temporary file, which replaces
+    the file, so a crash never leaves a partially written
+    file. Unless the durability is "none", the data is synced
+    before the rename. With "full" durability, the directory
+    is also synced, making the rename itself durable.
+
+    :param filepath: File path
+    :param data: File content, as `str` or `bytes`
+    :param durability: Durability mode
+    """
+
+    temp_path = get_temp_path(filepath)
+
+    try:
+        with open(temp_path, 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+
+            if durability != 'none':
+                file.flush()
+                os.fsync(file.fileno())
+
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if durability == 'full':
+        fsync_dir(path.dirname(filepath))
+
+
+class WriteBatch:
+    def __init__(self, durability: str = 'full') -> None:
+        """
+        Files written by a command, made durable together.
+
+        Files are written to temporary paths, then added to the
+        batch. With "full" durability, each added file is synced
+        and renamed at once, syncing its directory. With "batch"
+        durability, files are kept in their temporary paths until
+        `sync`, which syncs all files, renames them and syncs each
+        directory once. With "none", files are renamed at once,
+        without syncing.
+
+        In all modes, a file is never visible in its path before
+        it is completely written.
+
+        :param durability: Durability mode
+        """
+
+        self.durability = durability
+        self._pending = {}
+
+    def __contains__(self, filepath: str) -> bool:
+        return filepath in self._pending
+
+    def get_path(self, filepath: str) -> str:
+        """Get the path where the content of a file is,
+        its temporary path if the file was not synced yet.
+
+        :param filepath: File path
+        :return: Path of the file content
+        """
+
+        return self._pending.get(filepath, filepath)
+
+    def add(self, temp_path: str, filepath: str) -> None:
+        """Add a written file to the batch.
+
+        :param temp_path: Temporary path where the file was written
+        :param filepath: Final path of the file
+        """
+
+        # the same content written twice, by content-addressed
+        # storage, maybe more than once to the same temporary path
+        if filepath in self._pending:
+            if self._pending[filepath] != temp_path and path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        if self.durability == 'batch':
+            self._pending[filepath] = temp_path
+            return
+
+        # a temporary path added again was renamed when first added
+        if not path.exists(temp_path):
+            return
+
+        if self.durability == 'full':
+            fsync_file(temp_path)
+
+        os.replace(temp_path, filepath)
+
+        if self.durability == 'full':
+            fsync_dir(path.dirname(filepath))
+
+    def sync(self) -> None:
+        """Sync and rename all pending files, syncing each
+        directory once.
+        """
+
+        for temp_path in self._pending.values():
+            fsync_file(temp_path)
+
+        for filepath, temp_path in self._pending.items():
+            os.replace(temp_path, filepath)
+
+        for dirpath in {path.dirname(filepath) for filepath in self._pending}:
+            fsync_dir(dirpath)
+
+        self._pending.clear()
+
+    def detach(self) -> list:
+        """Remove all pending files from the batch, without
+        removing them, so they can be added to another batch.
+
+        :return: Temporary and final paths of the pending files
+        """
+
+        pending = [(temp_path, filepath) for filepath, temp_path in self._pending.items()]
+        self._pending.clear()
+        return pending
+
+    def discard(self) -> None:
+        """Remove all pending files."""
+
+        for temp_path in self._pending.values():
+            if path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._pending.clear()
@@ -0,0 +1,119 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import marshal
+from os import path
+from hashlib import sha1
+from collections import OrderedDict
+
+from .atomic import atomic_write
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class MergeCache:
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, persist: bool = False) -> None:
+        """
+        Least recently used cache of merged file objects,
+        keyed by file path and the last commit of the file.
+
+        :param max_size: Maximum memory used by merged objects,
+        in bytes (approximately)
+        :param persist: If true, the last merged object of each
+        file is also stored in `.box/cache`
+        """
+
+        self._cache_dir = path.join('.box', 'cache')
+        self._max_size = max_size
+        self._persist = persist
+
+        self._entries = OrderedDict()
+        self._size = 0
+
+    @staticmethod
+    def _get_size(merged: list) -> int:
+        return sum(len(line) for line in merged) + len(merged) * 16
+
+    def _get_cache_file(self, file: str) -> str:
+        return path.join(self._cache_dir, sha1(file.encode()).hexdigest())
+
+    def _load(self, file: str, commit_id: str) -> list:
+        try:
+            with open(self._get_cache_file(file), 'rb') as cache_file:
+                cached_commit, merged = marshal.load(cache_file)
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            return None
+
+        # files cached by older versions store line maps
+        if cached_commit == commit_id and isinstance(merged, list):
+            return merged
+
+    def _dump(self, file: str, commit_id: str, merged: list) -> None:
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+        atomic_write(self._get_cache_file(file), marshal.dumps((commit_id, merged)), durability='none')
+
+    def _add(self, key: tuple, merged: list) -> None:
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+
+        size = self._get_size(merged)
+
+        if size <= self._max_size:
+            self._entries[key] = (merged, size)
+            self._size += size
+
+            while self._size > self._max_size:
+                __, (__, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def get(self, file: str, commit_id: str) -> list:
+        """Get a copy of the merged lines of a file
+        at a commit.
+
+        :param file: File path
+        :param commit_id: Last commit of the file
+        :return: Merged lines, or None if not cached
+        """
+
+        key = (file, commit_id)
+        entry = self._entries.get(key)
+
+        if entry:
+            self._entries.move_to_end(key)
+            return list(entry[0])
+
+        if self._persist:
+            merged = self._load(file, commit_id)
+            if merged is not None:
+                self._add(key, merged)
+                return list(merged)
+
+    def set(self, file: str, commit_id: str, merged: list) -> None:
+        """Store the merged lines of a file at a commit.
+
+        :param file: File path
+        :param commit_id: Last commit of the file
+        :param merged: Merged lines
+        """
+
+        merged = list(merged)
+        self._add((file, commit_id), merged)
+
+        if self._persist:
+            self._dump(file, commit_id, merged)
@@ -15,69 +15,119 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import os
 import json
+import time
 import marshal
+from collections import deque
+from functools import partial
 from hashlib import md5, sha1
 from os import path
 from typing import List
 from datetime import datetime
 
 from .tracker import Tracker
+from .cache import MergeCache, DEFAULT_MAX_SIZE
+from .objects import ObjectStore, MAX_DELTA_DEPTH
+from .journal import CommitLog
+from .integrity import IntegrityCheckpoint, AuditReport
+from .history import CommitIndex, FileHistory, get_date_range
+from .filter import Filter
+from . import _config
+from . import diff
 from . import exceptions
 from . import utils
 
+# a full copy of the file lines is stored instead of a line
+# difference after this number of commits, or when the differences
+# stored since the last copy are larger than the copy itself
+SNAPSHOT_INTERVAL = 64
+
+# number of commits, per worker, whose objects are hashed
+# ahead of the commit chain check in an audit
+AUDIT_WINDOW = 16
+
+# instance used by each worker process to create file objects
+_worker_commit = None
+
 
 class Commit:
-    def __init__(self) -> None:
+    def __init__(self, tracker: Tracker = None, durability: str = None) -> None:
         """
         This class handles everything about `commits`.
+
+        :param tracker: Tracker of the repository files, used
+        to share a tracker session with the caller
+        :param durability: Durability mode of new files, read
+        from the repository config if not given
         """
 
         repo_path = '.box'
 
         self._commit_file = path.join(repo_path, 'commits.json')
+        self._commit_index = CommitIndex(repo_path)
+        self._file_history = FileHistory(repo_path)
         self._obj_file = path.join(repo_path, 'objects')
-        self._tracker = Tracker()
+        config = _config.get_repo_config()
+        durability = durability or _config.get_durability()
+
+        self._objects = ObjectStore(
+            self._obj_file,
+            compression=config.get('compression', 'none'),
+            delta_depth=config.get('delta_depth', MAX_DELTA_DEPTH),
+            durability=durability
+        )
+        self._log = CommitLog(repo_path, durability)
+        self._tracker = tracker or Tracker()
+        self._cache = MergeCache(
+            max_size=config.get('cache_size', DEFAULT_MAX_SIZE),
+            persist=config.get('cache_persist', False)
+        )
+        self._merged_files = {}
 
-        self._commits = self._get_commits()
+        self._commits = None
 
     def _dump_commit_file(self, commits: dict) -> None:
         self._commits = commits
-        with open(self._commit_file, 'w') as file:
-            json.dump(commits, file, indent=2)
+        self._log.write_all(commits)
+        self._commit_index.update(self._log)
 
-    def _create_object(self, file_diff: dict, obj_id: str) -> None:
-        object_path = path.join(self._obj_file, obj_id)
+        # object IDs may have changed
+        self._file_history.clear()
+        self._file_history.update(self._log)
 
-        with open(object_path, 'wb') as _object:
-            marshal.dump(file_diff, _object)
+        if path.isfile(self._commit_file):
+            os.remove(self._commit_file)
 
-    def _create_object_to_binary(self, file_content: bytes, obj_id: str) -> None:
-        object_path = path.join(self._obj_file, obj_id)
+    def _create_object(self, file_object: dict) -> tuple:
+        object_data = marshal.dumps(file_object)
+        return self._objects.write(object_data), len(object_data)
 
-        with open(object_path, 'wb') as _object:
-            _object.write(file_content)
+    def _create_object_to_binary(self, filepath: str, base_id: str = None) -> str:
+        return self._objects.write_file(filepath, base_id)
 
     def _get_object(self, object_id: str) -> dict:
-        object_path = path.join(self._obj_file, object_id)
-        with open(object_path, 'rb') as file:
-            object_data = marshal.load(file)
-
-        return object_data
+        return marshal.loads(self._objects.read(object_id))
 
     def _get_object_hash(self, object_id: str) -> bytes:
-        object_path = path.join(self._obj_file, object_id)
-        with open(object_path, 'rb') as file:
-            _hash = md5(file.read())
-
-        return _hash.digest()
+        return self._objects.get_hash(object_id)
 
     def _get_file_commits(self, filename: str) -> dict:
         commits = self.get_commits()
         file_commits = {cid: cdata for cid, cdata in commits.items() if filename in cdata['objects']}
         return file_commits
 
+    def _get_file_objects(self, filename: str) -> list:
+        if self._log.exists():
+            return [(cid, obj_id) for __, cid, obj_id in self._file_history.get(filename, self._log)]
+
+        file_commits = self._get_file_commits(filename)
+        return [(cid, commit['objects'][filename]) for cid, commit in file_commits.items()]
+
     def _get_commits(self) -> dict:
+        if self._log.exists():
+            return dict(self._log)
+
         try:
             with open(self._commit_file) as file:
                 commits = json.load(file)
@@ -86,9 +136,10 @@ class Commit:
 
         return commits
 
-    def _get_commit_hash(self, commit: dict) -> str:
+    def _get_commit_hash(self, commit: dict, get_object_hash=None) -> str:
+        get_object_hash = get_object_hash or self._get_object_hash
         commit = commit.copy()
-        objects_hashes = [self._get_object_hash(obj) for obj in commit.pop('objects').values()]
+        objects_hashes = [get_object_hash(obj) for obj in commit.pop('objects').values()]
         objects_sum_hash = md5(b''.join(objects_hashes)).hexdigest()
         commit_info = '.'.join([objects_sum_hash, *commit.values()])
         _hash = md5(commit_info.encode()).hexdigest()
@@ -96,19 +147,42 @@ class Commit:
         return _hash
 
     def _get_last_commit_hash(self) -> str:
-        commits = self.get_commits()
+        if self._commits is not None:
+            last_commit = list(self._commits.values())[-1] if self._commits else None
+        else:
+            last_commit = self._log.last()
+            last_commit = last_commit[1] if last_commit else None
 
-        if commits:
-            _hash = self._get_commit_hash(list(commits.values())[-1])
+        if last_commit:
+            _hash = self._get_commit_hash(last_commit)
         else:
             _hash = ''
 
         return _hash
 
-    def _merge_lines(self, objects: list) -> dict:
-        merged = {}
+    @staticmethod
+    def _merge_lines(objects: list) -> list:
+        merged = []
+        legacy_merged = None
+
         for obj in objects:
-            merged.update(obj)
+            if 'lines' in obj or 'hunks' in obj:
+                if legacy_merged is not None:
+                    merged = [legacy_merged[n] for n in sorted(legacy_merged) if legacy_merged[n] is not None]
+                    legacy_merged = None
+
+                if 'lines' in obj:
+                    merged = list(obj['lines'])
+                else:
+                    merged = diff.patch_lines(merged, obj['hunks'])
+            else:
+                # objects of older versions map line numbers
+                # to lines, or to None for deleted lines
+                legacy_merged = legacy_merged or {}
+                legacy_merged.update(obj)
+
+        if legacy_merged is not None:
+            merged = [legacy_merged[n] for n in sorted(legacy_merged) if legacy_merged[n] is not None]
 
         return merged
 
@@ -122,6 +196,9 @@ class Commit:
         :return: Commits
         """
 
+        if self._commits is None:
+            self._commits = self._get_commits()
+
         if until_commit_id:
             filtered_commits = {}
             for cid, cdata in self._commits.items():
@@ -135,65 +212,145 @@ class Commit:
 
         return self._commits
 
-    def merge_objects(self, file: str) -> dict:
-        """Merge all objects from file. The result is a
-        dictionary with enumerated lines.
+    def _merge_file_objects(self, file: str, file_objects: list, snapshot: int = 0) -> list:
+        if not file_objects:
+            return []
+
+        last_commit = file_objects[-1][0]
+        merged = self._cache.get(file, last_commit)
+
+        if merged is None:
+            if snapshot >= len(file_objects):
+                snapshot = 0
+
+            objects = [self._get_object(obj_id) for __, obj_id in file_objects[snapshot:]]
+            merged = self._merge_lines(objects)
+            self._cache.set(file, last_commit, merged)
+
+        return merged
+
+    def merge_objects(self, file: str, snapshot: int = None) -> list:
+        """Merge all objects from file. The result is
+        the list of file lines at the last commit.
+
+        The merge starts from the last full copy of the
+        file (snapshot), skipping all previous objects. Merged
+        objects are cached by the last commit of the file.
 
         :param file: File to merge
         :type file: str
-        :return: Merged objects
-        :rtype: dict
+        :param snapshot: Position of the last snapshot in the
+        file commits, read from the tracker if not given
+        :type snapshot: int, optional
+        :return: File lines
+        :rtype: list
         """
 
-        file_commits = self._get_file_commits(file)
-        file_objects = [self._get_object(commit['objects'][file]) for commit in file_commits.values()]
-        return self._merge_lines(file_objects)
+        if snapshot is None:
+            snapshot = self._tracker.get_tracked().get(file, {}).get('snapshot', 0)
 
-    def _create_commit_objects(self, files: list, _id: str) -> dict:
-        tracked = self._tracker.get_tracked()
+        return self._merge_file_objects(file, self._get_file_objects(file), snapshot)
+
+    @staticmethod
+    def _update_snapshot_info(file_info: dict, position: int, object_size: int, snapshot: bool) -> None:
+        if snapshot:
+            file_info['snapshot'] = position
+            file_info['snapshot_distance'] = 0
+            file_info['diff_size'] = 0
+        else:
+            file_info['snapshot_distance'] = file_info.get('snapshot_distance', 0) + 1
+            file_info['diff_size'] = file_info.get('diff_size', 0) + object_size
+
+    def _create_file_object(self, file: str, file_info: dict, file_objects: list, file_hash: str = None) -> tuple:
+        """Create the object of a file version.
+
+        :param file: File path
+        :param file_info: Tracker information of the file, not changed
+        :param file_objects: Commits and objects of the file
+        :param file_hash: File hash, if known
+        :return: Object ID, updated tracker information and file
+        lines (`None` for binary files)
+        """
+
+        file_info = dict(file_info)
+
+        if file_info['binary']:
+            # the object of the previous version is the base of a delta
+            base_id = file_objects[-1][1] if file_objects else None
+
+            file_info['hash'] = file_hash or self._tracker.get_file_hash(file)
+            file_info['committed'] = True
+            return self._create_object_to_binary(file, base_id), file_info, None
+
+        with open(file, 'r') as file_r:
+            file_lines = file_r.readlines()
+
+        file_object = {'lines': file_lines}
+        snapshot = True
+
+        if not file_info['committed']:
+            file_info['committed'] = True
+        else:
+            merged = self._merge_file_objects(file, file_objects, file_info.get('snapshot', 0))
+            file_info['hash'] = file_hash or self._tracker.get_file_hash(file)
+            hunks = diff.diff_lines(merged, file_lines)
+
+            merged_size = len(marshal.dumps(file_object))
+            diff_size = file_info.get('diff_size', 0) + len(marshal.dumps({'hunks': hunks}))
+
+            if file_info.get('snapshot_distance', 0) + 1 < SNAPSHOT_INTERVAL and diff_size <= merged_size:
+                file_object = {'hunks': hunks}
+                snapshot = False
+
+        object_id, object_size = self._create_object(file_object)
+        self._update_snapshot_info(file_info, len(file_objects), object_size, snapshot)
+
+        return object_id, file_info, file_lines
+
+    def _create_commit_objects(self, files: list, hashes: dict, tracked: dict, jobs: int = 1) -> dict:
         commit_objects = {}
 
+        # a file can be listed as both uncommitted and changed
+        files = list(dict.fromkeys(files))
+
         for file in files:
             if file not in tracked:
                 raise exceptions.FileNotTrackedError(f'File "{file}" not tracked')
 
+        tasks = []
+
         for file in files:
-            obj_id = utils.generate_id(_id, file)
-            commit_objects[file] = obj_id
             file_info = tracked[file]
 
-            if file_info['binary']:
-                current_hash = self._tracker.get_file_hash(file)
-                tracked[file]['hash'] = current_hash
-                with open(file, 'rb') as file_r:
-                    file_content = file_r.read()
-
-                if file_info['committed']:
-                    if tracked[file]['hash'] != current_hash:
-                        self._create_object_to_binary(file_content, obj_id)
-                else:
-                    tracked[file]['committed'] = True
-                    self._create_object_to_binary(file_content, obj_id)
+            # binary files not committed have no base object
+            if file_info['binary'] and not file_info['committed']:
+                file_objects = []
             else:
-                with open(file, 'r') as file_r:
-                    file_lines = utils.enumerate_lines(file_r.readlines())
+                file_objects = self._get_file_objects(file)
 
-                if not file_info['committed']:
-                    tracked[file]['committed'] = True
-                else:
-                    current_hash = self._tracker.get_file_hash(file)
+            tasks.append((file, file_info, file_objects, hashes.get(file)))
 
-                    if file_info['hash'] != current_hash:
-                        merged = self.merge_objects(file)
-                        tracked[file]['hash'] = current_hash
-                        file_lines = utils.difference_lines(merged, file_lines)
+        if jobs != 1 and len(tasks) > 1:
+            results = []
 
-                self._create_object(file_lines, obj_id)
+            # objects written by workers are synced by this process
+            for result, pending in utils.parallel_map(_create_file_object, tasks, jobs):
+                self._objects.add_pending(pending)
+                results.append(result)
+        else:
+            results = [self._create_file_object(*task) for task in tasks]
+
+        for file, (object_id, file_info, file_lines) in zip(files, results):
+            tracked[file] = file_info
+            commit_objects[file] = object_id
+
+            if file_lines is not None:
+                self._merged_files[file] = file_lines
 
-        self._tracker.dump_tracker(tracked)
         return commit_objects
 
-    def commit(self, author: str, author_email: str, files: List[str], message: str) -> str:
+    def commit(self, author: str, author_email: str, files: List[str],
+               message: str, hashes: dict = None, jobs: int = 1) -> str:
         """Commit files with a message.
 
         If is the first file commit, this method enumerate
@@ -210,16 +367,31 @@ class Commit:
         :type files: List[str]
         :param message: Message to describe changes
         :type message: str
+        :param hashes: Known hashes of the files, by file path.
+        Files without a known hash are hashed again.
+        :type hashes: dict
+        :param jobs: Number of processes that create the objects
+        of the files, `0` uses all CPUs
+        :type jobs: int
         :raises exceptions.NoFilesToCommitError: If no file has changed
         :return: Return commit ID
         :rtype: str
         """
 
-        commits = self.get_commits()
+        self.convert_commit_file()
+        self._merged_files = {}
 
         commit_datetime = str(datetime.now().replace(microsecond=0))
-        _id_parts = ''.join((author, author_email, message, commit_datetime))
-        commit_objects = self._create_commit_objects(files, _id_parts)
+        tracked = self._tracker.get_tracked()
+
+        try:
+            commit_objects = self._create_commit_objects(files, hashes or {}, tracked, jobs)
+        except BaseException:
+            self._objects.discard()
+            raise
+
+        # all new objects are durable before the commit is logged
+        self._objects.sync()
 
         if not commit_objects:
             raise exceptions.NoFilesToCommitError('No files to commit')
@@ -235,31 +407,310 @@ class Commit:
         _last_hash = self._get_last_commit_hash()
         _commit_id_parts = '.'.join((self._get_commit_hash(commit_data), _last_hash))
         commit_id = sha1(_commit_id_parts.encode()).hexdigest()
-        commits[commit_id] = commit_data
 
-        self._dump_commit_file(commits)
+        self._log.append(commit_id, commit_data)
+
+        # files are marked as committed only after the commit is logged
+        self._tracker.dump_tracker(tracked)
+
+        self._commit_index.update(self._log)
+        self._file_history.update(self._log)
+
+        if self._commits is not None:
+            self._commits[commit_id] = commit_data
+
+        for file, merged in self._merged_files.items():
+            self._cache.set(file, commit_id, merged)
+
         return commit_id
 
-    def check_integrity(self) -> bool:
+    def find_commits(self, author: str = None, email: str = None, date: str = None,
+                     since: str = None, until: str = None, filepath: str = None,
+                     skip: int = 0, limit: int = None):
+        """Find commits by author, email, date and file,
+        from the newest to the oldest.
+
+        The commit and file indexes are used, so only the found
+        commits are read from the commit log, as they are consumed.
+
+        :param author: Author name
+        :type author: str, optional
+        :param email: Author email
+        :type email: str, optional
+        :param date: Commit day, as `YYYY-MM-DD`
+        :type date: str, optional
+        :param since: First date, as `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS`
+        :type since: str, optional
+        :param until: Last date, inclusive
+        :type until: str, optional
+        :param filepath: Only commits of this file
+        :type filepath: str, optional
+        :param skip: Number of found commits skipped
+        :type skip: int, optional
+        :param limit: Maximum number of commits
+        :type limit: int, optional
+        :raises exceptions.InvalidDateError: If a date format is invalid
+        :return: Iterator of commit ID and commit data
+        """
+
+        since_key, until_key = get_date_range(date, since, until)
+        stop = skip + limit if limit is not None else None
+
+        # commits.json of older versions is converted on the next commit
+        if not self._log.exists():
+            commits = self._get_file_commits(filepath) if filepath else self.get_commits()
+            commits = Filter().filter(commits, author, email, date, since, until)
+            return list(reversed(commits.items()))[skip:stop]
+
+        if not any((author, email, since_key, until_key, filepath)):
+            return self._log.iter_positions(range(len(self._log) - 1, -1, -1)[skip:stop])
+
+        positions = self._commit_index.find(author or None, email or None, since_key, until_key, self._log)
+
+        if filepath:
+            file_positions = [position for position, __, __ in self._file_history.get(filepath, self._log)]
+            positions = sorted(set(file_positions).intersection(positions))
+
+        # skipped commits are not read
+        return self._log.iter_positions(positions[::-1][skip:stop])
+
+    def get_commits_count(self) -> int:
+        """Get the number of commits.
+
+        :return: Number of commits
+        :rtype: int
+        """
+
+        if self._commits is None and self._log.exists():
+            return len(self._log)
+
+        return len(self.get_commits())
+
+    def _resume_checkpoint(self, checkpoint: IntegrityCheckpoint) -> bool:
+        if not self._log.exists() or not 0 < checkpoint.position <= len(self._log):
+            return False
+
+        if checkpoint.log_size != self._log.get_size(checkpoint.position):
+            return False
+
+        return checkpoint.log_digest == self._log.get_digest(checkpoint.log_size)
+
+    def check_integrity(self, full: bool = False) -> bool:
         """Check commits integrity.
 
         If any commit is altered by a third party, `False` is
         returned, indicating that the commit chain is invalid.
 
+        The result of each check is saved as a checkpoint, so the
+        next check only verifies new commits and hashes objects
+        whose files changed since then.
+
+        :param full: Ignore the checkpoint and verify everything
+        :type full: bool
         :return: If chain is valid
         :rtype: bool
         """
 
-        commits = self.get_commits()
+        checkpoint = IntegrityCheckpoint(self._objects)
+        position = 0
         last_hash = ''
 
-        for commit_id in commits.keys():
-            c_hash = self._get_commit_hash(commits[commit_id])
+        if full:
+            checkpoint.reset()
+        elif self._resume_checkpoint(checkpoint):
+            if checkpoint.find_changed_object():
+                return False
+
+            position = checkpoint.position
+            last_hash = checkpoint.chain_hash
+
+        if self._log.exists():
+            commits = self._log.iter_from(position)
+        else:
+            commits = self.get_commits().items()
+
+        for commit_id, commit_data in commits:
+            try:
+                c_hash = self._get_commit_hash(commit_data, checkpoint.get_object_hash)
+            except FileNotFoundError:
+                return False
+
             _hash_parts = '.'.join((c_hash, last_hash)).encode()
             sum_hash = sha1(_hash_parts).hexdigest()
             if commit_id == sum_hash:
                 last_hash = c_hash
+                position += 1
             else:
                 return False
-        
+
+        self._save_checkpoint(checkpoint, position, last_hash)
         return True
+
+    def _save_checkpoint(self, checkpoint: IntegrityCheckpoint, position: int, last_hash: str) -> None:
+        if self._log.exists():
+            log_size = self._log.get_size(position)
+            checkpoint.save(position, last_hash, log_size, self._log.get_digest(log_size))
+        else:
+            checkpoint.save(0, '', 0, None)
+
+    @staticmethod
+    def _hash_ahead(commits, hashes: dict, hash_object, window: int):
+        pending = deque()
+
+        for commit_id, commit_data in commits:
+            for object_id in commit_data['objects'].values():
+                if object_id not in hashes:
+                    hashes[object_id] = hash_object(object_id)
+
+            pending.append((commit_id, commit_data))
+
+            if len(pending) > window:
+                yield pending.popleft()
+
+        yield from pending
+
+    def _find_broken_object(self, commit_data: dict, checkpoint: IntegrityCheckpoint) -> str:
+        for object_id in commit_data['objects'].values():
+            if not self._objects.exists(object_id):
+                return object_id
+
+            base_id = self._objects.get_delta_base(object_id)
+            if base_id is not None and not self._objects.exists(base_id):
+                return object_id
+
+            verified_hash = checkpoint.get_verified_hash(object_id)
+
+            if verified_hash is not None:
+                if verified_hash != self._objects.get_hash(object_id):
+                    return object_id
+            elif sha1(self._objects.read(object_id)).hexdigest() != object_id:
+                # objects not migrated to content-addressed IDs
+                # are also reported here, run `migrate` first
+                return object_id
+
+    def audit(self, jobs: int = 0) -> AuditReport:
+        """Check the integrity of all commits, hashing
+        objects in parallel.
+
+        Objects are hashed by a pool of threads while commits are
+        read, and their digests are folded into the commit chain
+        in order. The first commit that breaks the chain is
+        reported with the changed object, when found.
+
+        :param jobs: Number of workers, `0` uses all CPUs
+        :type jobs: int
+        :return: Audit report
+        :rtype: AuditReport
+        """
+
+        # imported here, since most commands never start a pool
+        from concurrent.futures import ThreadPoolExecutor
+
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+
+        previous_checkpoint = IntegrityCheckpoint(self._objects)
+        checkpoint = IntegrityCheckpoint(self._objects)
+        checkpoint.reset()
+
+        report = AuditReport()
+        start_time = time.perf_counter()
+        hashes = {}
+        last_hash = ''
+
+        if self._log.exists():
+            commits = iter(self._log)
+        else:
+            commits = iter(self.get_commits().items())
+
+        # hashlib releases the GIL while hashing, so threads hash objects in parallel
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            hash_object = partial(executor.submit, checkpoint.hash_object)
+
+            def get_object_hash(object_id: str) -> bytes:
+                return hashes[object_id].result()[0]
+
+            for commit_id, commit_data in self._hash_ahead(commits, hashes, hash_object, jobs * AUDIT_WINDOW):
+                try:
+                    c_hash = self._get_commit_hash(commit_data, get_object_hash)
+                except FileNotFoundError:
+                    c_hash = None
+                else:
+                    _hash_parts = '.'.join((c_hash, last_hash)).encode()
+
+                if c_hash is None or commit_id != sha1(_hash_parts).hexdigest():
+                    report.valid = False
+                    report.broken_commit = commit_id
+                    report.broken_object = self._find_broken_object(commit_data, previous_checkpoint)
+                    break
+
+                last_hash = c_hash
+                report.commits += 1
+
+            for future in hashes.values():
+                future.cancel()
+
+        for future in hashes.values():
+            if not future.cancelled() and future.exception() is None:
+                report.objects += 1
+                report.size += future.result()[1]
+
+        report.elapsed = time.perf_counter() - start_time
+
+        if report.valid:
+            self._save_checkpoint(checkpoint, report.commits, last_hash)
+
+        return report
+
+    def migrate_objects(self) -> int:
+        """Migrate objects created with random IDs to
+        content-addressed IDs, removing duplicated objects.
+
+        Commit IDs are not changed, since they do not
+        depend on object IDs.
+
+        :return: Number of migrated objects
+        :rtype: int
+        """
+
+        commits = self.get_commits()
+        object_ids = [obj_id for cdata in commits.values() for obj_id in cdata['objects'].values()]
+        migrated = self._objects.migrate(object_ids)
+
+        migrated = {obj_id: new_id for obj_id, new_id in migrated.items() if obj_id != new_id}
+
+        if migrated:
+            for cdata in commits.values():
+                for file, obj_id in cdata['objects'].items():
+                    cdata['objects'][file] = migrated.get(obj_id, obj_id)
+
+            self._dump_commit_file(commits)
+            self._objects.remove_migrated(migrated)
+
+        return len(migrated)
+
+    def convert_commit_file(self) -> bool:
+        """Convert the commits of a `commits.json` file,
+        used by older versions, to the append-only commit log.
+
+        :return: If the commits file was converted
+        :rtype: bool
+        """
+
+        if path.isfile(self._commit_file) and not self._log.exists():
+            self._dump_commit_file(self.get_commits())
+            return True
+
+        return False
+
+
+def _create_file_object(task: tuple) -> tuple:
+    # objects are kept pending in the worker, and the
+    # process that commits syncs them with its own objects
+    global _worker_commit
+
+    if _worker_commit is None:
+        _worker_commit = Commit(durability='batch')
+
+    result = _worker_commit._create_file_object(*task)
+    return result, _worker_commit._objects.detach_pending()
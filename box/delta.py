@@ -0,0 +1,161 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import struct
+
+# blocks of the base indexed to find copies, a copy
+# is at least this long
+BLOCK_SIZE = 32
+
+# target positions looked up in the index. The step is coprime
+# with the block size, so any copy of BLOCK_SIZE * (PROBE_STEP + 1)
+# bytes or more is found, whatever its offset in the base
+PROBE_STEP = 7
+
+COPY = 0
+INSERT = 1
+
+# instructions: copy a base range, or insert the following bytes
+_COPY = struct.Struct('>BQI')
+_INSERT = struct.Struct('>BI')
+
+# chunk compared at once when extending a copy
+_COMPARE_SIZE = 4096
+
+
+def _match_length(base: bytes, base_pos: int, target: bytes, target_pos: int) -> int:
+    limit = min(len(base) - base_pos, len(target) - target_pos)
+    length = 0
+
+    while length < limit:
+        size = min(_COMPARE_SIZE, limit - length)
+        base_start = base_pos + length
+        target_start = target_pos + length
+
+        if base[base_start:base_start + size] == target[target_start:target_start + size]:
+            length += size
+            continue
+
+        # binary search of the equal prefix in the chunk
+        low, high = 0, size - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if base[base_start:base_start + middle] == target[target_start:target_start + middle]:
+                low = middle
+            else:
+                high = middle - 1
+
+        return length + low
+
+    return length
+
+
+def _add_insert(delta: bytearray, data: bytes) -> None:
+    delta += _INSERT.pack(INSERT, len(data))
+    delta += data
+
+
+def create_delta(base: bytes, target: bytes, max_size: int = None) -> bytes:
+    """Create a delta that rebuilds `target` from `base`.
+
+    Blocks of the base are indexed by content, and every
+    `PROBE_STEP` target position is looked up in the index, so long
+    copies are always found. A found block is extended
+    in both directions and stored as a copy of the base range, the
+    remaining bytes are stored as inserts.
+
+    The search stops as soon as the delta would be larger than
+    `max_size`, so unrelated contents are not scanned entirely.
+
+    :param base: Base content
+    :param target: New content
+    :param max_size: Maximum delta size, `None` for no limit
+    :return: Delta instructions, or None if larger than `max_size`
+    """
+
+    if max_size is None:
+        max_size = len(target) + _INSERT.size
+
+    index = {}
+    for offset in range(len(base) - BLOCK_SIZE, -1, -BLOCK_SIZE):
+        index[base[offset:offset + BLOCK_SIZE]] = offset
+
+    delta = bytearray()
+    literal_start = 0
+    position = 0
+    last_position = len(target) - BLOCK_SIZE
+
+    # the pending insert makes the delta too large past this position
+    stop_position = max_size - _INSERT.size
+
+    while position <= last_position:
+        base_pos = index.get(target[position:position + BLOCK_SIZE])
+
+        if base_pos is None:
+            position += PROBE_STEP
+
+            if position > stop_position:
+                return None
+            continue
+
+        start, base_start = position, base_pos
+        while start > literal_start and base_start > 0 and target[start - 1] == base[base_start - 1]:
+            start -= 1
+            base_start -= 1
+
+        length = position - start + _match_length(base, base_pos, target, position)
+
+        if start > literal_start:
+            _add_insert(delta, target[literal_start:start])
+
+        delta += _COPY.pack(COPY, base_start, length)
+        position = literal_start = start + length
+        stop_position = literal_start + max_size - len(delta) - _INSERT.size
+
+    if literal_start < len(target):
+        _add_insert(delta, target[literal_start:])
+
+    if len(delta) > max_size:
+        return None
+
+    return bytes(delta)
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Rebuild content from its base and a delta
+    created by `create_delta`.
+
+    :param base: Base content
+    :param delta: Delta instructions
+    :return: Content
+    """
+
+    target = bytearray()
+    position = 0
+
+    while position < len(delta):
+        if delta[position] == COPY:
+            __, offset, length = _COPY.unpack_from(delta, position)
+            position += _COPY.size
+            target += base[offset:offset + length]
+        else:
+            __, length = _INSERT.unpack_from(delta, position)
+            position += _INSERT.size
+            target += delta[position:position + length]
+            position += length
+
+    return bytes(target)
@@ -0,0 +1,198 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from collections import Counter
+
+# differences needing more edits than this are stored as a
+# single hunk replacing the changed region, since the time and
+# memory of the diff grow with the square of the number of edits
+MAX_EDIT_COST = 512
+
+
+def _find_matches(old: list, new: list, max_cost: int) -> list:
+    # Myers' greedy algorithm: the furthest reaching path of each
+    # diagonal is stored for every number of edits, then the
+    # shortest edit script is walked back to collect matched lines
+    n, m = len(old), len(new)
+    trace = [{1: 0}]
+    choices = [None]
+    cost = None
+
+    for d in range(min(n + m, max_cost) + 1):
+        previous = trace[-1]
+        current = {}
+        chosen = {}
+
+        for k in range(-d, d + 1, 2):
+            # diagonals outside the edit graph
+            if k < -m or k > n:
+                continue
+
+            x_down = previous.get(k + 1)
+            x_right = previous.get(k - 1)
+
+            # moves leaving the edit graph are not allowed
+            if x_down is not None and x_down - k > m:
+                x_down = None
+            if x_right is not None and x_right + 1 > n:
+                x_right = None
+
+            if x_down is None and x_right is None:
+                continue
+            elif x_right is None or (x_down is not None and x_right < x_down):
+                x, chosen[k] = x_down, k + 1
+            else:
+                x, chosen[k] = x_right + 1, k - 1
+
+            y = x - k
+            while x < n and y < m and old[x] == new[y]:
+                x += 1
+                y += 1
+
+            current[k] = x
+
+            if x >= n and y >= m:
+                cost = d
+                break
+
+        trace.append(current)
+        choices.append(chosen)
+
+        if cost is not None:
+            break
+    else:
+        return None
+
+    matches = []
+    x, y = n, m
+    k = n - m
+
+    for d in range(cost + 1, 1, -1):
+        prev_k = choices[d][k]
+        prev_x = trace[d - 1][prev_k]
+        start_x = prev_x if prev_k == k + 1 else prev_x + 1
+
+        while x > start_x:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+
+        x, y, k = prev_x, prev_x - prev_k, prev_k
+
+    while x > 0:
+        x -= 1
+        y -= 1
+        matches.append((x, y))
+
+    matches.reverse()
+    return matches
+
+
+def diff_lines(old: list, new: list, max_cost: int = MAX_EDIT_COST) -> list:
+    """Get the differences between two lists of lines.
+
+    The differences are a list of hunks `(start, deleted, inserted)`:
+    `deleted` lines of `old` are removed from `start` and the
+    `inserted` lines are placed there. Hunks are sorted and
+    `start` refers to `old`, as expected by `patch_lines`.
+
+    :param old: Old lines
+    :param new: New lines
+    :param max_cost: Maximum number of edits searched
+    :return: Hunks list
+    """
+
+    prefix = 0
+    max_prefix = min(len(old), len(new))
+    while prefix < max_prefix and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    max_suffix = max_prefix - prefix
+    while suffix < max_suffix and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+
+    old_lines = old[prefix:len(old) - suffix]
+    new_lines = new[prefix:len(new) - suffix]
+
+    if not old_lines and not new_lines:
+        return []
+
+    if len(old_lines) == len(new_lines):
+        changed = [i for i, (old_line, new_line) in enumerate(zip(old_lines, new_lines)) if old_line != new_line]
+    else:
+        changed = None
+
+    # if no replaced line is found among the new lines, replacing
+    # the changed lines in place is already a shortest diff
+    if changed is not None and {old_lines[i] for i in changed}.isdisjoint(new_lines[i] for i in changed):
+        hunks = []
+
+        for i in changed:
+            if hunks and hunks[-1][0] + hunks[-1][1] == prefix + i:
+                start, deleted, inserted = hunks[-1]
+                inserted.append(new_lines[i])
+                hunks[-1] = (start, deleted + 1, inserted)
+            else:
+                hunks.append((prefix + i, 1, [new_lines[i]]))
+
+        return hunks
+
+    # each line of one list without an equal line in the other is
+    # an edit, so the changes need at least this number of edits
+    common = sum((Counter(old_lines) & Counter(new_lines)).values())
+    min_cost = len(old_lines) + len(new_lines) - 2 * common
+
+    if old_lines and new_lines and min_cost <= max_cost:
+        # lines are compared as integers, which is faster than strings
+        line_ids = {}
+        old_ids = [line_ids.setdefault(line, len(line_ids)) for line in old_lines]
+        new_ids = [line_ids.setdefault(line, len(line_ids)) for line in new_lines]
+        matches = _find_matches(old_ids, new_ids, max_cost) or []
+    else:
+        matches = []
+
+    hunks = []
+    old_pos = new_pos = 0
+
+    for old_index, new_index in matches + [(len(old_lines), len(new_lines))]:
+        if old_index > old_pos or new_index > new_pos:
+            hunks.append((prefix + old_pos, old_index - old_pos, new_lines[new_pos:new_index]))
+
+        old_pos, new_pos = old_index + 1, new_index + 1
+
+    return hunks
+
+
+def patch_lines(lines: list, hunks: list) -> list:
+    """Apply the hunks created by `diff_lines` to lines.
+
+    :param lines: Old lines
+    :param hunks: Hunks list
+    :return: New lines
+    """
+
+    patched = []
+    position = 0
+
+    for start, deleted, inserted in hunks:
+        patched.extend(lines[position:start])
+        patched.extend(inserted)
+        position = start + deleted
+
+    patched.extend(lines[position:])
+    return patched
@@ -28,3 +28,18 @@ class FileNotTrackedError(Exception):
 class NoFilesToCommitError(Exception):
     def __init__(self, *args) -> None:
         super().__init__(*args)
+
+
+class UnknownCodecError(Exception):
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+
+
+class InvalidDateError(Exception):
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+
+
+class LockTimeoutError(Exception):
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from .history import get_date_key, get_date_range
 
 
 class Filter:
@@ -14,16 +14,28 @@ class Filter:
 
         return {cid: commits[cid] for cid in filtered_cid}
 
-    def _filter_by_date(self, commits: dict, date: str) -> dict:
+    def _filter_by_date(self, commits: dict, since: int = None, until: int = None) -> dict:
         def fbd(cid):
-            commit_date = datetime.strptime(commits[cid]['date'], '%Y-%m-%d %H:%M:%S')
-            return date == commit_date.strftime('%Y-%m-%d')
+            date = get_date_key(commits[cid]['date'])
+            return (since is None or date >= since) and (until is None or date <= until)
 
         filtered_commits = {cid: commits[cid] for cid in filter(fbd, commits)}
         return filtered_commits
 
-    def filter(self, commits: dict, by_name: str = None,
-               by_email: str = None, by_date: str = None) -> dict:
+    def filter(self, commits: dict, by_name: str = None, by_email: str = None,
+               by_date: str = None, since: str = None, until: str = None) -> dict:
+        """Filter commits by scanning them. Repositories with
+        a commit log use the commit index instead.
+
+        :param commits: Commits
+        :param by_name: Author name
+        :param by_email: Author email
+        :param by_date: Commit day, as `YYYY-MM-DD`
+        :param since: First date, inclusive
+        :param until: Last date, inclusive
+        :return: Filtered commits
+        """
+
         filtered_commits = commits
         
         if by_name:
@@ -32,7 +44,8 @@ class Filter:
         if by_email:
             filtered_commits = self._filter_by_email(filtered_commits, by_email)
 
-        if by_date:
-            filtered_commits = self._filter_by_date(filtered_commits, by_date)
+        if by_date or since or until:
+            since_key, until_key = get_date_range(by_date, since, until)
+            filtered_commits = self._filter_by_date(filtered_commits, since_key, until_key)
 
         return filtered_commits
@@ -0,0 +1,392 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import struct
+import shutil
+from os import path
+from array import array
+from hashlib import sha1
+from bisect import bisect_left, bisect_right
+
+from .journal import CommitLog
+from .atomic import atomic_write
+from . import exceptions
+
+_DATE_SEPARATORS = str.maketrans('', '', '-: ')
+_MAX_DATE_KEY = 99991231235959
+
+
+def get_date_key(date: str, end: bool = False) -> int:
+    """Get a comparable integer from a commit date, so
+    dates are compared without being parsed.
+
+    A day (`YYYY-MM-DD`) is converted to its first second,
+    or to its last second if `end` is true.
+
+    :param date: Date, as `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS`
+    :param end: Use the end of the day
+    :raises exceptions.InvalidDateError: If the date format is invalid
+    :return: Date key, like `20230130154500`
+    """
+
+    key = date.strip().translate(_DATE_SEPARATORS)
+
+    if not key.isdigit() or len(key) not in (8, 14):
+        raise exceptions.InvalidDateError(f'Invalid date: {repr(date)}')
+
+    if len(key) == 8:
+        key += '235959' if end else '000000'
+
+    return int(key)
+
+
+def get_date_range(date: str = None, since: str = None, until: str = None) -> tuple:
+    """Combine a day and a date range in a range of date keys.
+
+    :param date: Day, as `YYYY-MM-DD`
+    :param since: First date, inclusive
+    :param until: Last date, inclusive
+    :return: First and last date keys, `None` if not limited
+    """
+
+    since_key = get_date_key(since) if since else None
+    until_key = get_date_key(until, end=True) if until else None
+
+    if date:
+        day_start, day_end = get_date_key(date), get_date_key(date, end=True)
+        since_key = max(since_key or 0, day_start)
+        until_key = min(until_key or day_end, day_end)
+
+    return since_key, until_key
+
+
+def _read_array(filepath: str, typecode: str) -> array:
+    values = array(typecode)
+
+    try:
+        with open(filepath, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return values
+
+    # a partial record is left by an interrupted write
+    values.frombytes(data[:len(data) - len(data) % values.itemsize])
+
+    if sys.byteorder == 'little':
+        values.byteswap()
+
+    return values
+
+
+def _append_values(filepath: str, values: array) -> None:
+    if sys.byteorder == 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    with open(filepath, 'ab') as file:
+        size = file.tell()
+        if size % values.itemsize:
+            file.truncate(size - size % values.itemsize)
+
+        file.write(values.tobytes())
+
+
+class CommitIndex:
+    def __init__(self, repo_path: str = '.box') -> None:
+        """
+        Index of commits by author, email and date.
+
+        Commits are referenced by their position in the commit
+        log. The dates of all commits are stored in order, and
+        each author and email has a list of the positions of
+        its commits. All files are append-only, so a commit
+        updates the index without rewriting it.
+
+        The index is only written by `update`, by commands that
+        hold the repository lock alone. Commits not indexed yet
+        are indexed in memory by `find`.
+
+        :param repo_path: Repository path
+        """
+
+        self._index_dir = path.join(repo_path, 'commit-index')
+        self._dates_file = path.join(self._index_dir, 'dates')
+        self._unsorted_file = path.join(self._index_dir, 'unsorted')
+
+    def _get_postings_file(self, field: str, value: str) -> str:
+        key = sha1(f'{field}:{value}'.encode()).hexdigest()
+        return path.join(self._index_dir, key)
+
+    def __len__(self) -> int:
+        try:
+            return path.getsize(self._dates_file) // 8
+        except FileNotFoundError:
+            return 0
+
+    def _get_last_date(self) -> int:
+        count = len(self)
+
+        if not count:
+            return 0
+
+        with open(self._dates_file, 'rb') as dates:
+            dates.seek((count - 1) * 8)
+            return int.from_bytes(dates.read(8), 'big')
+
+    def _index_commits(self, commit_log: CommitLog, start: int, last_date: int) -> tuple:
+        postings = {}
+        dates = array('Q')
+        unsorted = False
+
+        for position, (__, commit_data) in enumerate(commit_log.iter_from(start), start):
+            date = get_date_key(commit_data['date'])
+            unsorted = unsorted or date < last_date
+            last_date = date
+            dates.append(date)
+
+            for field, value in (('author', commit_data['author']), ('email', commit_data['author_email'])):
+                postings.setdefault(self._get_postings_file(field, value), array('I')).append(position)
+
+        return dates, postings, unsorted
+
+    def update(self, commit_log: CommitLog) -> None:
+        """Index the commits of the log that are not indexed.
+
+        The index files are appended without synchronization,
+        so the caller must hold the repository lock alone.
+
+        :param commit_log: Commit log
+        """
+
+        count = len(self)
+        log_count = len(commit_log)
+
+        # the log was truncated, so positions may be reused
+        if count > log_count:
+            shutil.rmtree(self._index_dir, ignore_errors=True)
+            count = 0
+
+        if count == log_count:
+            return
+
+        dates, postings, unsorted = self._index_commits(commit_log, count, self._get_last_date())
+        os.makedirs(self._index_dir, exist_ok=True)
+
+        for postings_file, positions in postings.items():
+            _append_values(postings_file, positions)
+
+        # dates are searched with binary search while
+        # the clock does not go back between commits
+        if unsorted:
+            open(self._unsorted_file, 'w').close()
+
+        # dates are written last, so commits are only
+        # indexed after their postings are written
+        _append_values(self._dates_file, dates)
+
+    def _find_postings(self, field: str, value: str, count: int) -> set:
+        postings = _read_array(self._get_postings_file(field, value), 'I')
+        return {position for position in postings if position < count}
+
+    def find(self, author: str = None, email: str = None, since: int = None,
+             until: int = None, commit_log: CommitLog = None) -> list:
+        """Find commits by author, email and a date range. All
+        given criteria must match.
+
+        :param author: Author name
+        :param email: Author email
+        :param since: Date key of the first date, from `get_date_key`
+        :param until: Date key of the last date, from `get_date_key`
+        :param commit_log: Commit log, to also find the commits
+        that are not indexed yet
+        :return: Sorted sequence of commit positions
+        """
+
+        dates = _read_array(self._dates_file, 'Q')
+        unsorted = path.isfile(self._unsorted_file)
+        log_count = len(commit_log) if commit_log is not None else len(dates)
+
+        # the log was rewritten after the index, so positions may be reused
+        if len(dates) > log_count:
+            dates = array('Q')
+            unsorted = False
+
+        count = len(dates)
+        new_postings = {}
+
+        if log_count > count:
+            new_dates, new_postings, new_unsorted = self._index_commits(commit_log, count, dates[-1] if dates else 0)
+            dates.extend(new_dates)
+            unsorted = unsorted or new_unsorted
+
+        def find_postings(field: str, value: str) -> set:
+            found = self._find_postings(field, value, count)
+            found.update(new_postings.get(self._get_postings_file(field, value), ()))
+            return found
+
+        positions = None
+
+        if author is not None:
+            positions = find_postings('author', author)
+
+        if email is not None:
+            found = find_postings('email', email)
+            positions = found if positions is None else positions & found
+
+        if since is not None or until is not None:
+            since = since or 0
+            until = until or _MAX_DATE_KEY
+
+            if unsorted:
+                in_range = {p for p, date in enumerate(dates) if since <= date <= until}
+            else:
+                in_range = range(bisect_left(dates, since), bisect_right(dates, until))
+
+            if positions is None:
+                positions = in_range
+            else:
+                positions = {p for p in positions if p in in_range}
+
+        if positions is None:
+            return range(len(dates))
+        elif isinstance(positions, range):
+            return positions
+
+        return sorted(positions)
+
+
+class FileHistory:
+    # record: commit position, binary commit ID and object ID
+    RECORD = struct.Struct('>Q20s20s')
+
+    def __init__(self, repo_path: str = '.box') -> None:
+        """
+        Index of the commits and objects of each file.
+
+        Each file has an append-only list of its commits, in
+        log order, so file operations read only the history of
+        the file instead of all commits.
+
+        The index is only written by `update`, by commands that
+        hold the repository lock alone. Commits not indexed yet
+        are read from the log by `get`.
+
+        :param repo_path: Repository path
+        """
+
+        self._history_dir = path.join(repo_path, 'file-history')
+        self._count_file = path.join(self._history_dir, 'count')
+
+    def _get_history_file(self, filepath: str) -> str:
+        return path.join(self._history_dir, sha1(filepath.encode()).hexdigest())
+
+    def __len__(self) -> int:
+        try:
+            with open(self._count_file, 'rb') as count_file:
+                return int.from_bytes(count_file.read(), 'big')
+        except FileNotFoundError:
+            return 0
+
+    def _set_count(self, count: int) -> None:
+        # the index is not synced, as the commit log it is built from
+        atomic_write(self._count_file, count.to_bytes(8, 'big'), 'none')
+
+    def clear(self) -> None:
+        """Remove the index, so it is built again
+        from the commit log on next use.
+        """
+
+        shutil.rmtree(self._history_dir, ignore_errors=True)
+
+    def update(self, commit_log: CommitLog) -> None:
+        """Index the commits of the log that are not indexed.
+
+        The history files are appended without synchronization,
+        so the caller must hold the repository lock alone.
+
+        :param commit_log: Commit log
+        """
+
+        count = len(self)
+        log_count = len(commit_log)
+
+        if count > log_count:
+            self.clear()
+            count = 0
+
+        if count == log_count:
+            return
+
+        records = {}
+
+        for position, (commit_id, commit_data) in enumerate(commit_log.iter_from(count), count):
+            for filepath, object_id in commit_data['objects'].items():
+                record = self.RECORD.pack(position, bytes.fromhex(commit_id), bytes.fromhex(object_id))
+                records.setdefault(filepath, bytearray()).extend(record)
+
+        os.makedirs(self._history_dir, exist_ok=True)
+
+        for filepath, file_records in records.items():
+            with open(self._get_history_file(filepath), 'ab') as history:
+                size = history.tell()
+                if size % self.RECORD.size:
+                    history.truncate(size - size % self.RECORD.size)
+
+                history.write(file_records)
+
+        # the count is written last, records of commits after
+        # it are left by an interrupted update and ignored
+        self._set_count(log_count)
+
+    def get(self, filepath: str, commit_log: CommitLog = None) -> list:
+        """Get the history of a file.
+
+        :param filepath: File path
+        :param commit_log: Commit log, to also read the commits
+        that are not indexed yet
+        :return: Commit position, commit ID and object ID of
+        each commit of the file, from the oldest to the newest
+        """
+
+        count = len(self)
+        log_count = len(commit_log) if commit_log is not None else count
+
+        # the log was rewritten after the index, so positions may be reused
+        if count > log_count:
+            count = 0
+
+        try:
+            with open(self._get_history_file(filepath), 'rb') as history:
+                data = history.read()
+        except FileNotFoundError:
+            data = b''
+
+        history = {}
+        data = data[:len(data) - len(data) % self.RECORD.size]
+
+        for position, commit_id, object_id in self.RECORD.iter_unpack(data):
+            if position < count:
+                history[position] = (position, commit_id.hex(), object_id.hex())
+
+        if log_count > count:
+            for position, (commit_id, commit_data) in enumerate(commit_log.iter_from(count), count):
+                if filepath in commit_data['objects']:
+                    history[position] = (position, commit_id, commit_data['objects'][filepath])
+
+        return sorted(history.values())
@@ -16,52 +16,233 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import re
 
+IGNORE_FILE = '.ignore'
 
-def _filter_filelist(path: str) -> str:
-    if not path.startswith('*'):
-        if path.startswith('/'):
-            path = path[1:]
+# the repository directory is never tracked
+DEFAULT_PATTERNS = ['.box/']
 
-        return os.path.abspath(path)
-    else:
-        return path
 
+def _translate_glob(pattern: str) -> str:
+    regex = []
+    index = 0
 
-def _path_has_ignored(ignored: list, path: str) -> bool:
-    for i in ignored:
-        if i in os.path.abspath(path):
-            return True
+    while index < len(pattern):
+        char = pattern[index]
 
+        if pattern.startswith('**/', index):
+            regex.append('(?:.*/)?')
+            index += 3
+            continue
+        elif pattern.startswith('**', index):
+            regex.append('.*')
+            index += 2
+            continue
+        elif char == '*':
+            regex.append('[^/]*')
+        elif char == '?':
+            regex.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', index + 2)
 
-def _load_ignore() -> list:
-    try:
-        with open('.ignore', 'r') as ignore_file:
-            filelist = ignore_file.readlines()
-    except FileNotFoundError:
-        ignored = []
-    else:
-        filelist = [file.replace('\n', '') for file in filelist]
-        filelist = [file for file in filelist if file]
-        ignored = list(map(_filter_filelist, filelist))
+            if end == -1:
+                regex.append(re.escape(char))
+            else:
+                chars = pattern[index + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
 
-    ignored.append('.box')
-    return ignored
+                regex.append(f'[{chars.replace(chr(92), chr(92) * 2)}]')
+                index = end
+        else:
+            regex.append(re.escape(char))
 
+        index += 1
 
-def get_non_ignored() -> list:
-    ignored = _load_ignore()
-    non_ignored = []
+    return ''.join(regex)
 
-    for root, __, files in os.walk('.'):
-        if not _path_has_ignored(ignored, root):
-            for file in files:
-                filepath = os.path.join(root, file)
-                if not _path_has_ignored(ignored, filepath):
-                    non_ignored.append(filepath.replace('./', ''))
 
-    ignore_with = [i.replace('*', '') for i in ignored if i.startswith('*')]
-    check_ignored = lambda f: not any([f.endswith(a) for a in ignore_with])
-    filtered_non_ignored = [f for f in non_ignored if check_ignored(f)]
+class IgnoreMatcher:
+    def __init__(self, patterns: list) -> None:
+        """
+        Matcher of gitignore-style patterns.
 
-    return filtered_non_ignored
+        A pattern matches a file or directory name at any depth,
+        or a path relative to the repository if it contains a
+        slash. A trailing slash matches only directories, and `!`
+        includes again paths ignored by previous patterns. `*`,
+        `?`, `[...]` and `**` are supported.
+
+        Patterns are compiled once. Without negations, all
+        patterns are joined in a single expression.
+
+        :param patterns: Patterns, in the order of the ignore file
+        """
+
+        self._rules = []
+
+        for pattern in patterns:
+            pattern = pattern.strip()
+
+            if not pattern or pattern.startswith('#'):
+                continue
+
+            negate = pattern.startswith('!')
+            pattern = pattern[1:] if negate else pattern
+
+            directory_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+
+            if not pattern:
+                continue
+
+            # patterns with a slash are relative to the repository
+            if '/' in pattern:
+                regex = _translate_glob(pattern.lstrip('/'))
+            else:
+                regex = '(?:.*/)?' + _translate_glob(pattern)
+
+            self._rules.append((regex, negate, directory_only))
+
+        self._has_negations = any(negate for __, negate, __ in self._rules)
+        self._compiled = [(re.compile(regex + '$'), negate, dir_only) for regex, negate, dir_only in self._rules]
+
+        file_regexes = [regex for regex, __, dir_only in self._rules if not dir_only]
+        all_regexes = [regex for regex, __, __ in self._rules]
+
+        self._file_regex = re.compile('(?:' + '|'.join(file_regexes) + ')$') if file_regexes else None
+        self._dir_regex = re.compile('(?:' + '|'.join(all_regexes) + ')$') if all_regexes else None
+
+    @classmethod
+    def from_file(cls, ignore_file: str = IGNORE_FILE):
+        """Load the patterns of an ignore file.
+
+        :param ignore_file: Ignore file path
+        :return: Matcher of the file patterns and default patterns
+        """
+
+        try:
+            with open(ignore_file, 'r') as file:
+                patterns = file.read().splitlines()
+        except FileNotFoundError:
+            patterns = []
+
+        return cls(DEFAULT_PATTERNS + patterns)
+
+    def is_ignored(self, relpath: str, is_dir: bool = False) -> bool:
+        """Check if a path is ignored.
+
+        :param relpath: Path relative to the repository, with `/`
+        :param is_dir: If the path is a directory
+        :return: If the path is ignored
+        """
+
+        if not self._has_negations:
+            regex = self._dir_regex if is_dir else self._file_regex
+            return bool(regex and regex.match(relpath))
+
+        # the last matching pattern decides
+        for regex, negate, dir_only in reversed(self._compiled):
+            if dir_only and not is_dir:
+                continue
+
+            if regex.match(relpath):
+                return not negate
+
+        return False
+
+
+class Scan:
+    def __init__(self, files: list) -> None:
+        """
+        Files found in a scan of the repository.
+
+        The stat result of each file is requested only once,
+        so the same file is not stat'ed again by the commands
+        that use the scan.
+
+        :param files: Relative file paths, in scan order
+        """
+
+        self._files = files
+        self._file_set = set(files)
+        self._stats = {}
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, relpath: str) -> bool:
+        return relpath in self._file_set
+
+    def stat(self, relpath: str) -> os.stat_result:
+        """Get the stat result of a file, calling
+        `stat` only in the first request.
+
+        :param relpath: File path relative to the repository
+        :return: File stat result
+        """
+
+        stat = self._stats.get(relpath)
+
+        if stat is None:
+            stat = os.stat(relpath)
+            self._stats[relpath] = stat
+
+        return stat
+
+
+def scan(matcher: IgnoreMatcher = None) -> Scan:
+    """Scan the files of the repository that are not
+    ignored, with `os.scandir`.
+
+    Ignored directories are not scanned, and the file type of
+    the directory entries is used, so no file is stat'ed
+    during the scan. Files are listed in the same order as
+    a top-down `os.walk`.
+
+    :param matcher: Ignore matcher, loaded from the ignore file if not given
+    :return: Scanned files
+    """
+
+    matcher = matcher or IgnoreMatcher.from_file()
+    files = []
+    pending = ['']
+
+    while pending:
+        # paths relative to the repository, without "./"
+        prefix = pending.pop()
+        dirs = []
+
+        try:
+            with os.scandir(prefix or '.') as directory:
+                for entry in directory:
+                    relpath = prefix + entry.name
+
+                    if entry.is_dir():
+                        # like os.walk, symbolic links to directories are not followed
+                        if not entry.is_symlink() and not matcher.is_ignored(relpath, is_dir=True):
+                            dirs.append(relpath + '/')
+                    elif entry.is_file() and not matcher.is_ignored(relpath):
+                        files.append(relpath)
+        except OSError:
+            continue
+
+        pending.extend(reversed(dirs))
+
+    return Scan(files)
+
+
+def get_non_ignored(matcher: IgnoreMatcher = None) -> list:
+    """Get the files of the repository that are not ignored.
+
+    Ignored directories are not walked.
+
+    :param matcher: Ignore matcher, loaded from the ignore file if not given
+    :return: Relative file paths
+    """
+
+    return list(scan(matcher))
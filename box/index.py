@@ -0,0 +1,142 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import time
+from os import path
+
+from .tracker import Tracker
+from .atomic import atomic_write
+from . import utils
+
+# files modified less than this before being hashed may
+# change again without their timestamp moving forward
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class Index:
+    def __init__(self) -> None:
+        """
+        Stat cache of tracked files.
+
+        For every hashed file the index stores its size,
+        modification time, inode and change time, allowing
+        the file hash to be reused while this information
+        stays the same.
+        """
+
+        self._index_file = path.join('.box', 'index.json')
+        self._entries = None
+        self._changed = False
+
+    @staticmethod
+    def _stat_key(stat: os.stat_result) -> list:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns]
+
+    def _get_entries(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self._index_file) as index:
+                    self._entries = json.load(index)
+            except FileNotFoundError:
+                self._entries = {}
+
+        return self._entries
+
+    def _update_entry(self, filepath: str, stat: os.stat_result,
+                      file_hash: str, hash_time: int) -> None:
+        entries = self._get_entries()
+
+        if stat.st_mtime_ns < hash_time - RACY_WINDOW_NS:
+            entries[filepath] = [*self._stat_key(stat), file_hash]
+            self._changed = True
+        elif entries.pop(filepath, None):
+            self._changed = True
+
+    def file_hash(self, filepath: str, stat: os.stat_result = None) -> str:
+        """Get the file hash, using the cached hash if
+        the file stat data has not changed.
+
+        Files modified in the same timestamp granularity
+        in which they were hashed ("racily clean" files) are
+        not cached, so they are always hashed again.
+
+        :param filepath: File path
+        :param stat: File stat result, if already known
+        :return: File hash
+        """
+
+        return self.file_hashes([filepath], {filepath: stat} if stat else None)[filepath]
+
+    def file_hashes(self, files: list, stats: dict = None, jobs: int = 1) -> dict:
+        """Get the hash of many files. Files whose stat
+        data has changed are hashed using `jobs` workers.
+
+        :param files: Files path
+        :param stats: Known stat results by file path
+        :param jobs: Number of workers used to hash files
+        :return: Hashes by file path
+        """
+
+        entries = self._get_entries()
+        stats = stats or {}
+        hashes = {}
+        changed = []
+
+        hash_time = time.time_ns()
+
+        for filepath in files:
+            stat = stats.get(filepath)
+
+            if stat is None:
+                stat = os.stat(filepath)
+
+            entry = entries.get(filepath)
+
+            if entry and entry[:4] == self._stat_key(stat):
+                hashes[filepath] = entry[4]
+            else:
+                changed.append((filepath, stat))
+
+        changed_hashes = utils.parallel_map(Tracker.get_file_hash, [f for f, __ in changed], jobs)
+
+        for (filepath, stat), file_hash in zip(changed, changed_hashes):
+            self._update_entry(filepath, stat, file_hash, hash_time)
+            hashes[filepath] = file_hash
+
+        return {filepath: hashes[filepath] for filepath in files}
+
+    def save(self, tracked: dict = None) -> None:
+        """Write the index if any entry was changed.
+
+        :param tracked: If given, entries of files that
+        are not tracked are discarded.
+        """
+
+        entries = self._get_entries()
+
+        if tracked is not None:
+            for filepath in [f for f in entries if f not in tracked]:
+                entries.pop(filepath)
+                self._changed = True
+
+        if self._changed:
+            # a stale index only makes files be hashed again
+            atomic_write(self._index_file, json.dumps(entries), durability='none')
+
+            self._changed = False
@@ -0,0 +1,204 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import time
+from os import path
+
+from .index import RACY_WINDOW_NS
+from .objects import ObjectStore
+from .atomic import atomic_write
+
+
+class IntegrityCheckpoint:
+    def __init__(self, objects: ObjectStore, repo_path: str = '.box') -> None:
+        """
+        Checkpoint of the last integrity check.
+
+        Stores the position and chain hash of the last verified
+        commit, the digest of the commit log until this commit
+        and the digest of each verified object together with
+        the stat data of its file. The next check only verifies
+        new commits and hashes objects that changed on disk.
+
+        :param objects: Object store
+        :param repo_path: Repository path
+        """
+
+        self._checkpoint_file = path.join(repo_path, 'integrity.json')
+        self._objects = objects
+        self._start_time = time.time_ns()
+        self._checked = {}
+
+        try:
+            with open(self._checkpoint_file) as checkpoint:
+                data = json.load(checkpoint)
+        except FileNotFoundError:
+            data = {}
+
+        self.position = data.get('position', 0)
+        self.chain_hash = data.get('hash', '')
+        self.log_size = data.get('log_size', 0)
+        self.log_digest = data.get('log_digest')
+        self._verified = data.get('objects', {})
+
+    def reset(self) -> None:
+        """Discard the checkpoint, so all commits
+        and objects are verified again.
+        """
+
+        self.position = 0
+        self.chain_hash = ''
+        self.log_size = 0
+        self.log_digest = None
+        self._verified = {}
+
+    @staticmethod
+    def _stat_key(stat) -> list:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns]
+
+    def get_object_hash(self, object_id: str) -> bytes:
+        """Get the object digest, hashing the object
+        only if its file changed since it was verified.
+
+        :param object_id: Object ID
+        :return: Object digest
+        """
+
+        if object_id in self._checked:
+            return self._checked[object_id][1]
+
+        stat = self._objects.stat(object_id)
+        stat_key = self._stat_key(stat)
+        verified = self._verified.get(object_id)
+
+        if verified and verified[0] == stat_key:
+            digest = bytes.fromhex(verified[1])
+        else:
+            digest = self._objects.get_hash(object_id)
+
+        # objects changed in the last moments may change again
+        # without a new modification time, so they are always hashed
+        if stat.st_mtime_ns >= self._start_time - RACY_WINDOW_NS:
+            stat_key = None
+
+        self._checked[object_id] = (stat_key, digest)
+        return digest
+
+    def hash_object(self, object_id: str) -> tuple:
+        """Hash an object, ignoring its verified digest.
+
+        :param object_id: Object ID
+        :return: Object digest and stored size
+        """
+
+        # stat is taken before hashing, so a change made while the
+        # object is hashed makes the next check hash it again
+        stat = self._objects.stat(object_id)
+        digest = self._objects.get_hash(object_id)
+        stat_key = self._stat_key(stat)
+
+        # a delta can not be read without its base
+        base_id = self._objects.get_delta_base(object_id)
+        if base_id is not None and not self._objects.exists(base_id):
+            raise FileNotFoundError(f'Delta base {base_id} of {object_id} not found')
+
+        if stat.st_mtime_ns >= self._start_time - RACY_WINDOW_NS:
+            stat_key = None
+
+        self._checked[object_id] = (stat_key, digest)
+        return digest, self._objects.get_size(object_id)
+
+    def get_verified_hash(self, object_id: str) -> bytes:
+        """Get the digest of an object when it was verified.
+
+        :param object_id: Object ID
+        :return: Object digest, or None if it was never verified
+        """
+
+        verified = self._verified.get(object_id)
+        if verified:
+            return bytes.fromhex(verified[1])
+
+    def find_changed_object(self) -> str:
+        """Check that all objects verified before are unchanged.
+
+        :return: ID of a changed or missing object, or None
+        """
+
+        for object_id, (__, digest) in self._verified.items():
+            try:
+                current_digest = self.get_object_hash(object_id)
+            except FileNotFoundError:
+                return object_id
+
+            if current_digest.hex() != digest:
+                return object_id
+
+    def save(self, position: int, chain_hash: str, log_size: int, log_digest: str) -> None:
+        """Save the checkpoint after a successful check.
+
+        :param position: Number of verified commits
+        :param chain_hash: Hash of the last verified commit
+        :param log_size: Size of the commit log until the last verified commit
+        :param log_digest: Digest of the commit log until the last verified commit
+        """
+
+        # objects verified before are checked again when the check
+        # resumes, so the objects checked now replace them, leaving
+        # out objects removed from the repository
+        verified = {}
+
+        for object_id, (stat_key, digest) in self._checked.items():
+            verified[object_id] = [stat_key, digest.hex()]
+
+        data = dict(
+            position=position,
+            hash=chain_hash,
+            log_size=log_size,
+            log_digest=log_digest,
+            objects=verified
+        )
+
+        # a lost checkpoint only makes the next check verify more commits
+        atomic_write(self._checkpoint_file, json.dumps(data), durability='none')
+
+
+class AuditReport:
+    def __init__(self) -> None:
+        """Result of a full integrity audit.
+
+        `broken_commit` is the first commit that does not match the
+        chain, and `broken_object` the object of this commit that
+        is missing or changed, if the commit data was not changed.
+        """
+
+        self.valid = True
+        self.commits = 0
+        self.objects = 0
+        self.size = 0
+        self.elapsed = 0.0
+        self.broken_commit = None
+        self.broken_object = None
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.size / 1e6 / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def commits_per_second(self) -> float:
+        return self.commits / self.elapsed if self.elapsed else 0.0
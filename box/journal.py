@@ -0,0 +1,279 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import struct
+from os import path
+from hashlib import md5
+
+from .atomic import atomic_write, fsync_dir, get_temp_path
+
+OFFSET = struct.Struct('>Q')
+
+
+class CommitLog:
+    def __init__(self, repo_path: str = '.box', durability: str = 'full') -> None:
+        """
+        Append-only commit log.
+
+        Each commit is stored as a compact JSON record in a
+        line of `commits.log`, and the offset of each record is
+        appended to `commits.idx`, so the log can be read from
+        the end or by position without parsing the whole file.
+
+        Unless the durability is "none", appended records are
+        synced. Offsets are not, since they are rebuilt from the
+        log if they do not match it.
+
+        :param repo_path: Repository path
+        :param durability: Durability mode
+        """
+
+        self._log_file = path.join(repo_path, 'commits.log')
+        self._index_file = path.join(repo_path, 'commits.idx')
+        self._durability = durability
+
+    @staticmethod
+    def _encode(commit_id: str, commit_data: dict) -> bytes:
+        return json.dumps([commit_id, commit_data], separators=(',', ':')).encode() + b'\n'
+
+    @staticmethod
+    def _decode(record: bytes) -> tuple:
+        commit_id, commit_data = json.loads(record)
+        return commit_id, commit_data
+
+    def exists(self) -> bool:
+        return path.isfile(self._log_file)
+
+    def __len__(self) -> int:
+        if self.exists() and not path.isfile(self._index_file):
+            # offsets removed by an interrupted `write_all`
+            self._recover()
+
+        try:
+            return path.getsize(self._index_file) // OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def _get_offset(self, index, position: int) -> int:
+        index.seek(position * OFFSET.size)
+        return OFFSET.unpack(index.read(OFFSET.size))[0]
+
+    def _recover(self) -> None:
+        # removes a partially written record and rebuilds
+        # the offsets of records written before a crash
+        try:
+            with open(self._log_file, 'rb') as log:
+                content = log.read()
+        except FileNotFoundError:
+            content = b''
+
+        complete_size = content.rfind(b'\n') + 1
+        offsets = []
+        offset = 0
+
+        for line in content[:complete_size].splitlines(keepends=True):
+            offsets.append(offset)
+            offset += len(line)
+
+        with open(self._log_file, 'ab') as log:
+            log.truncate(complete_size)
+
+        atomic_write(self._index_file, b''.join(OFFSET.pack(o) for o in offsets), self._durability)
+
+    def _is_consistent(self) -> bool:
+        log_size = path.getsize(self._log_file) if self.exists() else 0
+        count = len(self)
+
+        if not count:
+            return log_size == 0
+
+        with open(self._index_file, 'rb') as index, open(self._log_file, 'rb') as log:
+            log.seek(self._get_offset(index, count - 1))
+            last_record = log.readline()
+            record_end = log.tell()
+
+        return last_record.endswith(b'\n') and record_end == log_size
+
+    def append(self, commit_id: str, commit_data: dict) -> None:
+        """Append a commit to the log.
+
+        :param commit_id: Commit ID
+        :param commit_data: Commit data
+        """
+
+        if not self._is_consistent():
+            self._recover()
+
+        with open(self._log_file, 'ab') as log:
+            offset = log.tell()
+            log.write(self._encode(commit_id, commit_data))
+
+            if self._durability != 'none':
+                log.flush()
+                os.fsync(log.fileno())
+
+        with open(self._index_file, 'ab') as index:
+            index.write(OFFSET.pack(offset))
+
+    def write_all(self, commits: dict) -> None:
+        """Replace the log with all given commits.
+
+        :param commits: Commits by commit ID
+        """
+
+        offsets = []
+        offset = 0
+        log_temp_path = get_temp_path(self._log_file)
+        index_temp_path = get_temp_path(self._index_file)
+
+        with open(log_temp_path, 'wb') as log:
+            for commit_id, commit_data in commits.items():
+                record = self._encode(commit_id, commit_data)
+                offsets.append(offset)
+                log.write(record)
+                offset += len(record)
+
+            log.flush()
+            os.fsync(log.fileno())
+
+        with open(index_temp_path, 'wb') as index:
+            index.write(b''.join(OFFSET.pack(o) for o in offsets))
+            index.flush()
+            os.fsync(index.fileno())
+
+        # the old offsets are removed before the log is replaced, so
+        # they never point into the new log. If the process stops before
+        # the new offsets are in place, they are rebuilt from the log
+        if path.isfile(self._index_file):
+            os.remove(self._index_file)
+
+        os.replace(log_temp_path, self._log_file)
+        os.replace(index_temp_path, self._index_file)
+        fsync_dir(path.dirname(self._log_file))
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, position: int):
+        """Iterate commits from a position of the log
+        to the newest commit.
+
+        :param position: Position of the first commit
+        """
+
+        count = len(self)
+
+        if position >= count:
+            return
+
+        with open(self._index_file, 'rb') as index, open(self._log_file, 'rb') as log:
+            log.seek(self._get_offset(index, position))
+            for _ in range(position, count):
+                yield self._decode(log.readline())
+
+    def get_size(self, position: int) -> int:
+        """Get the size of the log until a position, that
+        is, the size of all records before it.
+
+        :param position: Commit position
+        :return: Size in bytes
+        """
+
+        if position < len(self):
+            with open(self._index_file, 'rb') as index:
+                return self._get_offset(index, position)
+
+        if not position:
+            return 0
+
+        with open(self._index_file, 'rb') as index, open(self._log_file, 'rb') as log:
+            log.seek(self._get_offset(index, position - 1))
+            log.readline()
+            return log.tell()
+
+    def get_digest(self, size: int) -> str:
+        """Get the MD5 digest of the first bytes of the log.
+
+        :param size: Number of bytes
+        :return: Hexadecimal digest
+        """
+
+        _hash = md5()
+
+        with open(self._log_file, 'rb') as log:
+            while size > 0:
+                chunk = log.read(min(size, 1024 * 1024))
+                if not chunk:
+                    break
+
+                _hash.update(chunk)
+                size -= len(chunk)
+
+        return _hash.hexdigest()
+
+    def read_at(self, position: int) -> tuple:
+        """Read the commit at a position of the log.
+
+        :param position: Commit position, negative positions
+        are counted from the end
+        :return: Commit ID and commit data
+        """
+
+        count = len(self)
+
+        if position < 0:
+            position += count
+
+        if not 0 <= position < count:
+            raise IndexError('Commit position out of range')
+
+        with open(self._index_file, 'rb') as index, open(self._log_file, 'rb') as log:
+            log.seek(self._get_offset(index, position))
+            return self._decode(log.readline())
+
+    def iter_reversed(self):
+        """Iterate commits from the newest to the oldest,
+        reading only the records that are consumed.
+        """
+
+        yield from self.iter_positions(range(len(self) - 1, -1, -1))
+
+    def iter_positions(self, positions):
+        """Iterate the commits at the given positions, reading
+        only the records that are consumed.
+
+        :param positions: Sequence of commit positions
+        """
+
+        if not positions:
+            return
+
+        with open(self._index_file, 'rb') as index, open(self._log_file, 'rb') as log:
+            for position in positions:
+                log.seek(self._get_offset(index, position))
+                yield self._decode(log.readline())
+
+    def last(self) -> tuple:
+        """Get the last commit.
+
+        :return: Commit ID and commit data, or None
+        """
+
+        if len(self):
+            return self.read_at(-1)
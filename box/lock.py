@@ -0,0 +1,159 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import time
+from os import path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from . import exceptions
+
+DEFAULT_LOCK_TIMEOUT = 30
+
+# interval between attempts to get the lock, doubled up to the maximum
+MIN_RETRY_INTERVAL = 0.001
+MAX_RETRY_INTERVAL = 0.05
+
+
+class RepositoryLock:
+    def __init__(self, repo_path: str = '.box', timeout: float = DEFAULT_LOCK_TIMEOUT) -> None:
+        """
+        Reader/writer lock of a repository, using `fcntl.flock`
+        on `.box/lock`.
+
+        Commands that only read the repository share the lock,
+        and commands that change it hold the lock alone. Locks
+        are released by the system when a process ends, so a
+        crashed process never leaves the repository locked.
+
+        The process holding the exclusive lock writes its PID in
+        the lock file and clears it on release. If the PID is
+        still there when the exclusive lock is taken, the previous
+        writer crashed, and its leftover temporary files are removed.
+
+        Without `fcntl` (on Windows), locking is disabled.
+
+        :param repo_path: Repository path
+        :param timeout: Seconds to wait for the lock
+        """
+
+        self._repo_path = repo_path
+        self._lock_file = path.join(repo_path, 'lock')
+        self._timeout = timeout
+        self._fd = None
+        self._exclusive = False
+
+    def _try_lock(self, exclusive: bool) -> bool:
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+        try:
+            fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        return True
+
+    def _get_holder(self) -> str:
+        try:
+            with open(self._lock_file) as lock_file:
+                return lock_file.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def _recover(self) -> None:
+        # no other process writes to the repository while the
+        # exclusive lock is held, so all temporary files are stale
+        for root, __, files in os.walk(self._repo_path):
+            for file in files:
+                if file.endswith('.tmp'):
+                    os.remove(path.join(root, file))
+
+    def acquire(self, exclusive: bool = False) -> None:
+        """Get the lock, waiting until it is free.
+
+        :param exclusive: If true, get the lock alone, to write
+        :raises exceptions.LockTimeoutError: If the lock is
+        not free before the timeout
+        """
+
+        if fcntl is None:
+            return
+
+        self._fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self._timeout
+        interval = MIN_RETRY_INTERVAL
+
+        while not self._try_lock(exclusive):
+            if time.monotonic() >= deadline:
+                holder = self._get_holder()
+                self.release()
+
+                holder_info = f' by process {holder}' if holder else ''
+                raise exceptions.LockTimeoutError(
+                    f'Repository locked{holder_info} for more than {self._timeout}s'
+                )
+
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_RETRY_INTERVAL)
+
+        if exclusive:
+            if self._get_holder():
+                self._recover()
+
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, str(os.getpid()).encode(), 0)
+            self._exclusive = True
+
+    def release(self) -> None:
+        """Release the lock, clearing the PID of the writer."""
+
+        if self._fd is None:
+            return
+
+        if self._exclusive:
+            os.ftruncate(self._fd, 0)
+            self._exclusive = False
+
+        os.close(self._fd)
+        self._fd = None
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock shared with other readers."""
+
+        self.acquire(exclusive=False)
+
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the lock alone, to write to the repository."""
+
+        self.acquire(exclusive=True)
+
+        try:
+            yield self
+        finally:
+            self.release()
@@ -0,0 +1,707 @@
+# Box, file versioning.
+# Copyright (C) 2023  Firlast
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import zlib
+import mmap
+import shutil
+import struct
+from os import path
+from hashlib import md5, sha1
+
+from . import exceptions
+from . import utils
+from .atomic import WriteBatch, get_temp_path, fsync_dir
+from .delta import create_delta, apply_delta
+
+# header of encoded objects: magic, codec and content size
+OBJECT_MAGIC = b'\x00box'
+HEADER_SIZE = len(OBJECT_MAGIC) + 9
+
+CODECS = {'none': 0, 'zlib': 1, 'lzma': 2}
+
+# delta objects store the base object ID and the chain depth
+# after the header, followed by the delta instructions
+DELTA_CODEC = 3
+DELTA_HEADER_SIZE = HEADER_SIZE + 21
+
+# deltas are applied over each base of the chain when an
+# object is read, so chains are ended with a full object
+MAX_DELTA_DEPTH = 16
+
+# contents larger than this are always stored in full, since the
+# base and the content are read in memory to create a delta
+MAX_DELTA_SIZE = 8 * 1024 * 1024
+
+# signatures of formats that are already compressed
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b',  # gzip
+    b'PK\x03\x04',  # zip, docx, jar...
+    b'\x89PNG',
+    b'\xff\xd8\xff',  # jpeg
+    b'GIF8',
+    b'\xfd7zXZ\x00',
+    b'BZh',
+    b'\x28\xb5\x2f\xfd',  # zstandard
+    b'7z\xbc\xaf\x27\x1c',
+    b'Rar!',
+    b'OggS',
+    b'fLaC',
+    b'ID3',
+)
+
+
+def _lzma_available() -> bool:
+    try:
+        import lzma
+    except ImportError:  # Python built without lzma support
+        return False
+
+    return True
+
+
+def _get_compressor(codec: str):
+    if codec == 'zlib':
+        return zlib.compressobj()
+    elif codec == 'lzma':
+        import lzma
+        return lzma.LZMACompressor()
+
+
+def _decompress(codec_id: int, data: bytes) -> bytes:
+    if codec_id == CODECS['zlib']:
+        return zlib.decompress(data)
+    elif codec_id == CODECS['lzma']:
+        import lzma
+        return lzma.decompress(data)
+
+    return data
+
+
+def _is_compressed(data: bytes) -> bool:
+    return data.startswith(COMPRESSED_SIGNATURES) or data[4:8] == b'ftyp'
+
+
+def _make_header(codec: str, size: int) -> bytes:
+    return OBJECT_MAGIC + bytes((CODECS[codec],)) + size.to_bytes(8, 'big')
+
+
+def _is_delta(data: bytes) -> bool:
+    return data.startswith(OBJECT_MAGIC) and data[len(OBJECT_MAGIC)] == DELTA_CODEC
+
+
+def _make_delta_header(size: int, base_id: str, depth: int) -> bytes:
+    header = OBJECT_MAGIC + bytes((DELTA_CODEC,)) + size.to_bytes(8, 'big')
+    return header + bytes.fromhex(base_id) + bytes((depth,))
+
+
+def _decode(data: bytes) -> bytes:
+    if data.startswith(OBJECT_MAGIC):
+        return _decompress(data[len(OBJECT_MAGIC)], data[HEADER_SIZE:])
+
+    return data
+
+
+def _get_raw_size(header: bytes, size: int) -> int:
+    if header.startswith(OBJECT_MAGIC) and len(header) >= HEADER_SIZE:
+        return int.from_bytes(header[len(OBJECT_MAGIC) + 1:HEADER_SIZE], 'big')
+
+    return size
+
+
+class _Pack:
+    # index record: binary object ID, offset and size in the pack
+    RECORD = struct.Struct('>20sQQ')
+
+    def __init__(self, pack_path: str) -> None:
+        """
+        Pack of objects, with a sorted index of
+        object IDs read with binary search.
+
+        :param pack_path: Pack file path, without extension
+        """
+
+        self.pack_path = pack_path
+
+        with open(pack_path + '.pack', 'rb') as pack, open(pack_path + '.idx', 'rb') as index:
+            self._pack = self._map(pack)
+            self._index = self._map(index)
+
+        self._count = len(self._index) // self.RECORD.size
+
+    @staticmethod
+    def _map(file):
+        # empty files can not be mapped, a pack of
+        # empty objects has no data
+        if not os.fstat(file.fileno()).st_size:
+            return b''
+
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def write(cls, pack_path: str, object_files: dict) -> None:
+        """Write a pack and its index, copying the object
+        files in chunks, so memory usage does not depend on
+        the size of the objects.
+
+        The index is written after the pack, so a pack is
+        only found once it is complete.
+
+        :param pack_path: Pack file path, without extension
+        :param object_files: Stored object file path by object ID
+        """
+
+        records = []
+        pack_temp_path = get_temp_path(pack_path + '.pack')
+        index_temp_path = get_temp_path(pack_path + '.idx')
+
+        with open(pack_temp_path, 'wb') as pack:
+            for object_id, object_path in object_files.items():
+                offset = pack.tell()
+
+                with open(object_path, 'rb') as _object:
+                    shutil.copyfileobj(_object, pack, utils.HASH_BUFFER_SIZE)
+
+                records.append((bytes.fromhex(object_id), offset, pack.tell() - offset))
+
+            pack.flush()
+            os.fsync(pack.fileno())
+
+        with open(index_temp_path, 'wb') as index:
+            for record in sorted(records):
+                index.write(cls.RECORD.pack(*record))
+
+            index.flush()
+            os.fsync(index.fileno())
+
+        os.replace(pack_temp_path, pack_path + '.pack')
+        os.replace(index_temp_path, pack_path + '.idx')
+        fsync_dir(path.dirname(pack_path))
+
+    def _get_record(self, position: int) -> tuple:
+        return self.RECORD.unpack_from(self._index, position * self.RECORD.size)
+
+    def find(self, object_id: str) -> memoryview:
+        """Find an object in the pack.
+
+        :param object_id: Object ID
+        :return: Stored object data, or None if not found
+        """
+
+        try:
+            key = bytes.fromhex(object_id)
+        except ValueError:
+            return None
+
+        low, high = 0, self._count
+
+        while low < high:
+            middle = (low + high) // 2
+            record_key, offset, size = self._get_record(middle)
+
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return memoryview(self._pack)[offset:offset + size]
+
+    def get_objects(self):
+        for position in range(self._count):
+            key, offset, size = self._get_record(position)
+            yield key.hex(), memoryview(self._pack)[offset:offset + size]
+
+
+class ObjectStore:
+    def __init__(
+        self,
+        objects_path: str = path.join('.box', 'objects'),
+        compression: str = 'none',
+        delta_depth: int = MAX_DELTA_DEPTH,
+        durability: str = 'full'
+    ) -> None:
+        """
+        Content-addressed object storage.
+
+        The ID of an object is the SHA-1 hash of its
+        content, so identical contents are stored once.
+
+        Objects can be compressed with `zlib` or `lzma`. A
+        compressed object starts with a header that identifies
+        its codec, so objects are decoded automatically.
+
+        Files can be stored as a delta against the object of
+        their previous version, if the delta is smaller.
+
+        Objects are written to temporary files and renamed when
+        complete. With "batch" durability, new objects are only
+        synced and renamed by `sync`.
+
+        :param objects_path: Objects directory
+        :param compression: Codec of new objects
+        :param delta_depth: Maximum length of delta chains,
+        `0` disables deltas
+        :param durability: Durability mode of new objects
+        """
+
+        if compression not in CODECS or (compression == 'lzma' and not _lzma_available()):
+            raise exceptions.UnknownCodecError(f'Compression codec {repr(compression)} not available')
+
+        self._objects_path = objects_path
+        self._packs_path = path.join(path.dirname(objects_path), 'packs')
+        self._compression = compression
+        self._delta_depth = delta_depth
+        self._batch = WriteBatch(durability)
+        self._packs = None
+
+    def _get_object_path(self, object_id: str) -> str:
+        return path.join(self._objects_path, object_id)
+
+    def _get_packs(self) -> list:
+        if self._packs is None:
+            try:
+                filelist = sorted(os.listdir(self._packs_path))
+            except FileNotFoundError:
+                filelist = []
+
+            pack_paths = [path.join(self._packs_path, f[:-4]) for f in filelist if f.endswith('.idx')]
+            self._packs = [_Pack(pack_path) for pack_path in pack_paths]
+
+        return self._packs
+
+    def _find_packed(self, object_id: str) -> memoryview:
+        for pack in self._get_packs():
+            data = pack.find(object_id)
+            if data is not None:
+                return data
+
+    def _get_loose_objects(self) -> list:
+        return [f for f in os.listdir(self._objects_path) if not f.endswith('.tmp')]
+
+    def exists(self, object_id: str) -> bool:
+        object_path = self._get_object_path(object_id)
+        return object_path in self._batch or path.isfile(object_path) or self._find_packed(object_id) is not None
+
+    def sync(self) -> None:
+        """Make the objects written in "batch" durability
+        durable and visible in their paths.
+        """
+
+        self._batch.sync()
+
+    def discard(self) -> None:
+        """Remove the objects not synced yet."""
+
+        self._batch.discard()
+
+    def detach_pending(self) -> list:
+        """Remove the objects not synced yet from this store,
+        without removing their files, to add them to another
+        store with `add_pending`.
+
+        :return: Temporary and final paths of the objects
+        """
+
+        return self._batch.detach()
+
+    def add_pending(self, pending: list) -> None:
+        """Add objects written, but not synced, by another store.
+
+        :param pending: Temporary and final paths of the objects
+        """
+
+        for temp_path, object_path in pending:
+            self._batch.add(temp_path, object_path)
+
+    def _encode(self, data: bytes) -> bytes:
+        if self._compression != 'none' and not _is_compressed(data):
+            compressor = _get_compressor(self._compression)
+            compressed = compressor.compress(data) + compressor.flush()
+
+            if len(compressed) + HEADER_SIZE < len(data):
+                return _make_header(self._compression, len(data)) + compressed
+
+        if data.startswith(OBJECT_MAGIC):
+            return _make_header('none', len(data)) + data
+
+        return data
+
+    def _write_compressed_file(self, filepath: str, object_path: str) -> bool:
+        temp_path = get_temp_path(object_path)
+        compressor = _get_compressor(self._compression)
+        size = path.getsize(filepath)
+
+        with open(filepath, 'rb') as file, open(temp_path, 'wb') as _object:
+            _object.write(_make_header(self._compression, size))
+            for chunk in iter(lambda: file.read(utils.HASH_BUFFER_SIZE), b''):
+                _object.write(compressor.compress(chunk))
+            _object.write(compressor.flush())
+            compressed_size = _object.tell()
+
+        if compressed_size < size:
+            self._batch.add(temp_path, object_path)
+            return True
+
+        os.remove(temp_path)
+        return False
+
+    def write(self, data: bytes) -> str:
+        """Store a new object, if it does not exist.
+
+        :param data: Object content
+        :return: Object ID
+        """
+
+        object_id = sha1(data).hexdigest()
+
+        if not self.exists(object_id):
+            object_path = self._get_object_path(object_id)
+            temp_path = get_temp_path(object_path)
+
+            with open(temp_path, 'wb') as _object:
+                _object.write(self._encode(data))
+
+            self._batch.add(temp_path, object_path)
+
+        return object_id
+
+    def _read_stored(self, object_id: str, size: int = -1) -> bytes:
+        try:
+            with open(self._batch.get_path(self._get_object_path(object_id)), 'rb') as _object:
+                return _object.read(size)
+        except FileNotFoundError:
+            data = self._find_packed(object_id)
+            if data is None:
+                raise
+
+            return bytes(data[:size] if size >= 0 else data)
+
+    def get_delta_depth(self, object_id: str) -> int:
+        """Get the number of deltas applied to read an object.
+
+        :param object_id: Object ID
+        :return: Delta chain depth, `0` for full objects
+        """
+
+        header = self._read_stored(object_id, DELTA_HEADER_SIZE)
+        return header[-1] if _is_delta(header) else 0
+
+    def get_delta_base(self, object_id: str) -> str:
+        """Get the base object of a delta.
+
+        :param object_id: Object ID
+        :return: Base object ID, or None for full objects
+        """
+
+        header = self._read_stored(object_id, DELTA_HEADER_SIZE)
+        if _is_delta(header):
+            return header[HEADER_SIZE:DELTA_HEADER_SIZE - 1].hex()
+
+    def _get_delta_bases(self) -> set:
+        delta_bases = set()
+
+        for object_id in self._get_loose_objects():
+            base_id = self.get_delta_base(object_id)
+            if base_id is not None:
+                delta_bases.add(base_id)
+
+        for pack in self._get_packs():
+            for __, data in pack.get_objects():
+                header = bytes(data[:DELTA_HEADER_SIZE])
+                if _is_delta(header):
+                    delta_bases.add(header[HEADER_SIZE:DELTA_HEADER_SIZE - 1].hex())
+
+        return delta_bases
+
+    def _write_delta(self, filepath: str, object_path: str, base_id: str) -> bool:
+        size = path.getsize(filepath)
+
+        if size > MAX_DELTA_SIZE or not self.exists(base_id):
+            return False
+
+        depth = self.get_delta_depth(base_id) + 1
+        if depth > self._delta_depth:
+            return False
+
+        base = self.read(base_id)
+        if len(base) > MAX_DELTA_SIZE:
+            return False
+
+        # objects with random IDs, created before objects were
+        # content-addressed, are renamed by `migrate`
+        if sha1(base).hexdigest() != base_id:
+            return False
+
+        with open(filepath, 'rb') as file:
+            data = file.read()
+
+        # deltas larger than half of the content are not worth
+        # reading the base for, so the search stops early
+        delta = create_delta(base, data, size // 2)
+        if delta is None:
+            return False
+
+        delta = _make_delta_header(size, base_id, depth) + delta
+
+        if len(delta) >= len(self._encode(data)):
+            return False
+
+        temp_path = get_temp_path(object_path)
+
+        with open(temp_path, 'wb') as _object:
+            _object.write(delta)
+
+        self._batch.add(temp_path, object_path)
+        return True
+
+    def write_file(self, filepath: str, base_id: str = None) -> str:
+        """Store the content of a file as a new object,
+        if it does not exist.
+
+        :param filepath: File path
+        :param base_id: Object of the previous version of
+        the file, used as base of a delta
+        :return: Object ID
+        """
+
+        object_id = utils.hash_file(filepath, sha1).hexdigest()
+        object_path = self._get_object_path(object_id)
+
+        if not self.exists(object_id):
+            if base_id and self._delta_depth > 0:
+                if self._write_delta(filepath, object_path, base_id):
+                    return object_id
+            with open(filepath, 'rb') as file:
+                signature = file.read(HEADER_SIZE)
+
+            if self._compression != 'none' and not _is_compressed(signature):
+                if self._write_compressed_file(filepath, object_path):
+                    return object_id
+
+            temp_path = get_temp_path(object_path)
+
+            if signature.startswith(OBJECT_MAGIC):
+                with open(filepath, 'rb') as file, open(temp_path, 'wb') as _object:
+                    _object.write(_make_header('none', path.getsize(filepath)))
+                    shutil.copyfileobj(file, _object)
+            else:
+                shutil.copyfile(filepath, temp_path)
+
+            self._batch.add(temp_path, object_path)
+
+        return object_id
+
+    def read(self, object_id: str) -> bytes:
+        """Read the content of an object, decompressing
+        it or applying its delta if needed.
+
+        :param object_id: Object ID
+        :return: Object content
+        """
+
+        data = self._read_stored(object_id)
+
+        if _is_delta(data):
+            base_id = data[HEADER_SIZE:DELTA_HEADER_SIZE - 1].hex()
+            return apply_delta(self.read(base_id), data[DELTA_HEADER_SIZE:])
+
+        return _decode(data)
+
+    def get_stats(self) -> dict:
+        """Get the number of objects, the size they use on
+        disk and their size without compression.
+
+        :return: Objects statistics
+        """
+
+        stats = dict(objects=0, size=0, raw_size=0, packed=0)
+
+        for object_id in self._get_loose_objects():
+            object_path = self._get_object_path(object_id)
+
+            with open(object_path, 'rb') as _object:
+                header = _object.read(HEADER_SIZE)
+
+            size = path.getsize(object_path)
+            stats['objects'] += 1
+            stats['size'] += size
+            stats['raw_size'] += _get_raw_size(header, size)
+
+        for pack in self._get_packs():
+            for __, data in pack.get_objects():
+                stats['objects'] += 1
+                stats['packed'] += 1
+                stats['size'] += len(data)
+                stats['raw_size'] += _get_raw_size(bytes(data[:HEADER_SIZE]), len(data))
+
+        return stats
+
+    def stat(self, object_id: str) -> os.stat_result:
+        """Get the stat result of the file that stores an
+        object: the object file or the pack that contains it.
+
+        :param object_id: Object ID
+        :return: Stat result
+        """
+
+        try:
+            return os.stat(self._get_object_path(object_id))
+        except FileNotFoundError:
+            for pack in self._get_packs():
+                if pack.find(object_id) is not None:
+                    return os.stat(pack.pack_path + '.pack')
+
+            raise
+
+    def get_size(self, object_id: str) -> int:
+        """Get the stored size of an object.
+
+        :param object_id: Object ID
+        :return: Size in bytes
+        """
+
+        try:
+            return os.path.getsize(self._get_object_path(object_id))
+        except FileNotFoundError:
+            data = self._find_packed(object_id)
+            if data is None:
+                raise
+
+            return len(data)
+
+    def get_hash(self, object_id: str) -> bytes:
+        """Get the MD5 digest of a stored object.
+
+        :param object_id: Object ID
+        :return: Object digest
+        """
+
+        try:
+            return utils.hash_file(self._get_object_path(object_id)).digest()
+        except FileNotFoundError:
+            data = self._find_packed(object_id)
+            if data is None:
+                raise
+
+            return md5(data).digest()
+
+    def pack(self) -> int:
+        """Move the loose objects into a new pack, keeping
+        the existing packs. Loose objects are removed after
+        the pack is written.
+
+        :return: Number of packed loose objects
+        """
+
+        loose_objects = {}
+
+        for object_id in self._get_loose_objects():
+            try:
+                bytes.fromhex(object_id)
+            except ValueError:
+                continue
+
+            if len(object_id) == 40:
+                loose_objects[object_id] = self._get_object_path(object_id)
+
+        # objects already packed are only removed
+        new_objects = {
+            object_id: object_path for object_id, object_path in loose_objects.items()
+            if self._find_packed(object_id) is None
+        }
+
+        if new_objects:
+            os.makedirs(self._packs_path, exist_ok=True)
+            pack_name = 'pack-' + sha1(''.join(sorted(new_objects)).encode()).hexdigest()
+            _Pack.write(path.join(self._packs_path, pack_name), new_objects)
+
+        for object_path in loose_objects.values():
+            os.remove(object_path)
+
+        self._packs = None
+        return len(loose_objects)
+
+    def migrate(self, object_ids: list) -> dict:
+        """Store objects with random IDs under the hash of
+        their content.
+
+        The new IDs are created as links, or as copies of packed
+        objects, before the old ones are removed with
+        `remove_migrated`, so objects stay reachable while
+        commits are updated.
+
+        :param object_ids: Objects IDs
+        :return: New object IDs by old object ID
+        """
+
+        migrated = {}
+
+        for object_id in object_ids:
+            object_path = self._get_object_path(object_id)
+
+            if object_id in migrated or not self.exists(object_id):
+                continue
+
+            is_loose = path.isfile(object_path)
+
+            # encoded objects are identified by their decoded content
+            if self._read_stored(object_id, len(OBJECT_MAGIC)) == OBJECT_MAGIC:
+                new_id = sha1(self.read(object_id)).hexdigest()
+            elif is_loose:
+                new_id = utils.hash_file(object_path, sha1).hexdigest()
+            else:
+                new_id = sha1(self._find_packed(object_id)).hexdigest()
+
+            if new_id != object_id and not self.exists(new_id):
+                new_path = self._get_object_path(new_id)
+
+                if is_loose:
+                    try:
+                        os.link(object_path, new_path)
+                    except OSError:
+                        shutil.copyfile(object_path, new_path)
+                else:
+                    # the stored data is copied, so the object hash is kept
+                    temp_path = get_temp_path(new_path)
+
+                    with open(temp_path, 'wb') as _object:
+                        _object.write(self._find_packed(object_id))
+
+                    self._batch.add(temp_path, new_path)
+
+            migrated[object_id] = new_id
+
+        self.sync()
+        return migrated
+
+    def remove_migrated(self, migrated: dict) -> None:
+        """Remove the objects stored under their old IDs.
+
+        Deltas store the ID of their base, so old IDs that are
+        still the base of a delta are kept.
+
+        :param migrated: New object IDs by old object ID
+        """
+
+        delta_bases = self._get_delta_bases()
+
+        for object_id, new_id in migrated.items():
+            object_path = self._get_object_path(object_id)
+
+            # packs are not rewritten, packed old IDs are left unused
+            if object_id != new_id and object_id not in delta_bases and path.isfile(object_path):
+                os.remove(object_path)
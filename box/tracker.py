@@ -16,10 +16,110 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import json
+import codecs
+import locale
 from os import path
-from hashlib import md5
+from functools import partial
+from contextlib import contextmanager
 
+from . import _config
 from . import exceptions
+from . import utils
+from .atomic import atomic_write
+
+# size of the file prefix checked for NUL bytes and signatures
+SNIFF_SIZE = 8000
+
+# text in these encodings is not readable in the text
+# encoding of the system, so they are handled as binary
+BINARY_SIGNATURES = (
+    codecs.BOM_UTF32_LE,
+    codecs.BOM_UTF32_BE,
+    codecs.BOM_UTF16_LE,
+    codecs.BOM_UTF16_BE
+)
+
+FILE_TYPES = ('text', 'binary')
+
+
+class ContentClassifier:
+    def __init__(self, encoding: str = None) -> None:
+        """
+        Classify a file as text or binary from its
+        content, receiving it in chunks.
+
+        The first chunk is sniffed for NUL bytes and
+        signatures of UTF-16 and UTF-32 text. Then, the content
+        is decoded in the system text encoding (the encoding
+        used to read text files) until it turns out invalid,
+        without keeping the decoded text.
+
+        :param encoding: Text encoding, the system encoding by default
+        """
+
+        self._encoding = encoding or locale.getpreferredencoding(False)
+        self._decoder = codecs.getincrementaldecoder(self._encoding)()
+        self._sniffed = False
+        self._binary = False
+
+    def update(self, chunk) -> None:
+        if self._binary:
+            return
+
+        if not self._sniffed:
+            prefix = bytes(chunk[:SNIFF_SIZE])
+            self._sniffed = True
+
+            if b'\x00' in prefix or prefix.startswith(BINARY_SIGNATURES):
+                self._binary = True
+                return
+
+        try:
+            self._decoder.decode(chunk)
+        except UnicodeDecodeError:
+            self._binary = True
+
+    def is_binary(self) -> bool:
+        """Check if the received content is binary.
+
+        :return: True, if the content is binary
+        """
+
+        if not self._binary:
+            try:
+                # a multibyte character cut at the end is invalid
+                self._decoder.decode(b'', final=True)
+            except UnicodeDecodeError:
+                self._binary = True
+
+        return self._binary
+
+
+def get_file_types() -> dict:
+    """Get the file types set by extension in the
+    `file_types` repository option, like `{".svg": "text"}`.
+
+    :return: File types by lowercase extension
+    """
+
+    file_types = _config.get_repo_config().get('file_types', {})
+    return {
+        ('.' + ext.lstrip('.')).lower(): file_type
+        for ext, file_type in file_types.items() if file_type in FILE_TYPES
+    }
+
+
+def _get_file_info(filepath: str, file_types: dict = None) -> tuple:
+    file_type = (file_types or {}).get(path.splitext(filepath)[1].lower())
+
+    if file_type:
+        return Tracker.get_file_hash(filepath), file_type == 'binary'
+
+    # the file is read only once, to hash and classify it
+    classifier = ContentClassifier()
+    file_hash = utils.hash_file(filepath, inspector=classifier).hexdigest()
+
+    return file_hash, classifier.is_binary()
 
 
 class Tracker:
@@ -30,23 +130,47 @@ class Tracker:
 
         self._tracker_file = path.join('.box', 'tracker.json')
 
+        # tracked files of the open session, if any
+        self._session_tracked = None
+        self._session_changed = False
+
     @staticmethod
     def get_file_hash(filepath: str) -> str:
-        with open(filepath, 'rb') as file:
-            _hash = md5(file.read())
+        return utils.hash_file(filepath).hexdigest()
 
-        return _hash.hexdigest()
+    @contextmanager
+    def session(self):
+        """Open a session, where the tracked files are read
+        once and all changes are kept in memory, being written
+        in a single write when the session ends.
 
-    def dump_tracker(self, data: dict) -> None:
-        with open(self._tracker_file, 'w') as tracker:
-            json.dump(data, tracker, indent=2)
+        If the session ends with an exception, its changes are
+        discarded. Nested sessions are part of the outer session.
 
-    def get_tracked(self) -> dict:
-        """
-        Get all tracked files.
-        :return: Tracked files
+        Usage:
+            with tracker.session():
+                tracker.track(files)
+                tracker.update_track_info(file, committed=True)
+
+        :return: The tracker itself
         """
 
+        if self._session_tracked is not None:
+            yield self
+            return
+
+        self._session_tracked = self._load_tracker()
+        self._session_changed = False
+
+        try:
+            yield self
+
+            if self._session_changed:
+                self._write_tracker(self._session_tracked)
+        finally:
+            self._session_tracked = None
+
+    def _load_tracker(self) -> dict:
         try:
             with open(self._tracker_file) as tracker:
                 tracked = json.load(tracker)
@@ -55,6 +179,31 @@ class Tracker:
 
         return tracked
 
+    def _write_tracker(self, data: dict) -> None:
+        atomic_write(self._tracker_file, json.dumps(data, separators=(',', ':')), _config.get_durability())
+
+    def dump_tracker(self, data: dict) -> None:
+        if self._session_tracked is not None:
+            self._session_tracked = data
+            self._session_changed = True
+        else:
+            self._write_tracker(data)
+
+    def get_tracked(self) -> dict:
+        """
+        Get all tracked files.
+
+        In a session, the tracked files of the session
+        are returned, not a copy.
+
+        :return: Tracked files
+        """
+
+        if self._session_tracked is not None:
+            return self._session_tracked
+
+        return self._load_tracker()
+
     def get_tracked_file(self, filepath: str) -> dict:
         tracked = self.get_tracked()
         try:
@@ -86,7 +235,7 @@ class Tracker:
         else:
             raise exceptions.FileNotTrackedError(f'File "{filepath}" not tracked')
 
-    def track(self, files_list: list) -> None:
+    def track(self, files_list: list, jobs: int = 1) -> None:
         """
         Track a new files.
 
@@ -95,21 +244,16 @@ class Tracker:
         `self._tracker_file`.
 
         :param files_list: Files path to track
+        :param jobs: Number of workers used to hash files
         :return: None
         """
 
         tracked = self.get_tracked()
+        files_list = list(files_list)
+        get_file_info = partial(_get_file_info, file_types=get_file_types())
+        files_info = utils.parallel_map(get_file_info, files_list, jobs)
 
-        for filepath in files_list:
-            try:
-                with open(filepath) as _test_file:
-                    _test_file.read()
-            except UnicodeDecodeError:
-                binary = True
-            else:
-                binary = False
-
-            file_hash = self.get_file_hash(filepath)
+        for filepath, (file_hash, binary) in zip(files_list, files_info):
             tracked[filepath] = dict(hash=file_hash, committed=False, binary=binary)
 
         self.dump_tracker(tracked)
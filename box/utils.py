@@ -15,8 +15,22 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
-from hashlib import sha1
-from secrets import token_hex
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial, wraps
+from hashlib import md5
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# file system calls made by this process, by audit event name
+SYSCALLS = Counter()
+
+# audit hooks can not be removed, so the hook
+# only counts calls while this is true
+_counting = False
+_audit_hook_added = False
 
 
 def enumerate_lines(file_lines: list) -> dict:
@@ -44,12 +58,33 @@ def difference_lines(older_enum_lines: dict, new_enum_lines: dict) -> dict:
     return difference
 
 
-def generate_id(*complements: str) -> str:
-    id_parts = ''.join((
-        token_hex(16),
-        *complements
-    ))
-    return sha1(id_parts.encode()).hexdigest()
+def hash_file(filepath: str, algorithm=md5, inspector=None):
+    """Hash a file reading it in fixed-size chunks
+    into a reused buffer, so memory usage does not
+    depend on the file size.
+
+    :param filepath: File path
+    :param algorithm: `hashlib` constructor
+    :param inspector: Object whose `update` method also
+    receives every chunk, in the same read pass
+    :return: Hash object
+    """
+
+    _hash = algorithm()
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+
+    with open(filepath, 'rb', buffering=0) as file:
+        size = file.readinto(buffer)
+        while size:
+            _hash.update(view[:size])
+
+            if inspector is not None:
+                inspector.update(view[:size])
+
+            size = file.readinto(buffer)
+
+    return _hash
 
 
 def divide_list(parts: int, iterable: list) -> list:
@@ -66,3 +101,82 @@ def divide_list(parts: int, iterable: list) -> list:
         return split_list
     else:
         raise ValueError('"parts" must be at least 1')
+
+
+def _map_chunk(func, chunk: list) -> list:
+    return [func(item) for item in chunk]
+
+
+def parallel_map(func, items: list, jobs: int = 1) -> list:
+    """Apply `func` to every item using a process pool.
+
+    The items are divided in chunks, each chunk is processed
+    by a worker, and the results are returned in the same order
+    as `items`, exactly as `[func(i) for i in items]` would.
+
+    :param func: A picklable function
+    :param items: Items to process
+    :param jobs: Number of workers, `0` uses all CPUs
+    :return: Results list
+    """
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1 or len(items) < 2:
+        return [func(item) for item in items]
+
+    # imported here, since most commands never start a pool
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = divide_list(min(len(items), jobs * 4), items)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(partial(_map_chunk, func), chunks)
+        return [result for chunk in results for result in chunk]
+
+
+def _count_syscall(event: str, args: tuple) -> None:
+    if _counting and (event == 'open' or event.startswith('os.')):
+        SYSCALLS[event] += 1
+
+
+def _count_stat(stat):
+    @wraps(stat)
+    def counted_stat(*args, **kwargs):
+        SYSCALLS[f'os.{stat.__name__}'] += 1
+        return stat(*args, **kwargs)
+
+    return counted_stat
+
+
+@contextmanager
+def count_syscalls():
+    """Count the file system calls of this process in
+    `SYSCALLS` while the context is active.
+
+    Calls are counted with audit events, available since Python
+    3.8. `stat` has no audit event, so `os.stat` and `os.lstat`
+    are replaced by counting wrappers, which also count the
+    `os.path` checks, and restored on exit.
+    """
+
+    global _counting, _audit_hook_added
+
+    if _counting:
+        yield
+        return
+
+    if not _audit_hook_added and hasattr(sys, 'addaudithook'):
+        sys.addaudithook(_count_syscall)
+        _audit_hook_added = True
+
+    stat, lstat = os.stat, os.lstat
+    os.stat, os.lstat = _count_stat(stat), _count_stat(lstat)
+    _counting = True
+
+    try:
+        yield
+    finally:
+        _counting = False
+        os.stat, os.lstat = stat, lstat
@@ -3,13 +3,28 @@ import sys
 import json
 import shutil
 import marshal
+import hashlib
+import tempfile
+import multiprocessing
 
 import bupytest
 
 sys.path.insert(0, './')
 
 from box import tracker
+from box import exceptions
 from box import commit
+from box import index
+from box import utils
+from box import cache
+from box import objects
+from box import journal
+from box import diff
+from box import history
+from box import ignore
+from box import atomic
+from box import lock
+from box import __main__ as cli
 
 REPO_DIR = '.box'
 OBJECT_DIR = os.path.join(REPO_DIR, 'objects')
@@ -107,6 +122,83 @@ class TestTracker(bupytest.UnitTest):
         )
 
 
+    def test_binary_detection(self):
+        contents = {
+            'text.txt': 'Olá, mundo!\n'.encode() * 5000,
+            'nul.dat': b'abc\x00def',
+            'utf16.txt': 'text'.encode('utf-16'),
+            'late.dat': b'a' * (utils.HASH_BUFFER_SIZE + 10) + b'\xff',
+            'cut.dat': 'ã'.encode()[:1]
+        }
+
+        files_info = {}
+
+        for filename, content in contents.items():
+            filepath = os.path.join(FILE_TESTS_DIR, filename)
+
+            with open(filepath, 'wb') as file:
+                file.write(content)
+
+            files_info[filename] = tracker._get_file_info(filepath)
+            os.remove(filepath)
+
+            self.assert_expected(files_info[filename][0], hashlib.md5(content).hexdigest())
+
+        self.assert_false(files_info['text.txt'][1], message='Text file classified as binary')
+
+        for filename in ('nul.dat', 'utf16.txt', 'late.dat', 'cut.dat'):
+            self.assert_true(files_info[filename][1], message=f'{filename} classified as text')
+
+    def test_file_type_override(self):
+        with open(os.path.join(REPO_DIR, 'config.json'), 'w') as config:
+            json.dump({'file_types': {'DAT': 'text', '.txt': 'binary', '.md': 'unknown'}}, config)
+
+        file_types = tracker.get_file_types()
+        os.remove(os.path.join(REPO_DIR, 'config.json'))
+
+        self.assert_expected(file_types, {'.dat': 'text', '.txt': 'binary'})
+
+        filepath = os.path.join(FILE_TESTS_DIR, 'data.DAT')
+
+        with open(filepath, 'wb') as file:
+            file.write(b'\x00\x01')
+
+        __, binary = tracker._get_file_info(filepath, file_types)
+        os.remove(filepath)
+
+        self.assert_false(binary, message='File type override ignored')
+
+
+    def test_session(self):
+        session_tracker = tracker.Tracker()
+        session_tracker._tracker_file = os.path.join(FILE_TESTS_DIR, 'tracker.json')
+
+        with session_tracker.session():
+            session_tracker.track([TEST_FILE_1])
+            session_tracker.track([TEST_FILE_2])
+            session_tracker.update_track_info(TEST_FILE_1, committed=True)
+
+            self.assert_false(os.path.isfile(session_tracker._tracker_file), message='Tracker written in session')
+            self.assert_true(session_tracker.get_tracked()[TEST_FILE_1]['committed'])
+
+        with open(session_tracker._tracker_file) as tracker_file:
+            tracked = json.load(tracker_file)
+
+        self.assert_expected(sorted(tracked), sorted([TEST_FILE_1, TEST_FILE_2]))
+        self.assert_true(tracked[TEST_FILE_1]['committed'])
+
+        # changes of a session ended by an error are discarded
+        try:
+            with session_tracker.session():
+                session_tracker.update_track_info(TEST_FILE_2, committed=True)
+                session_tracker.update_track_info('not-tracked.txt', committed=True)
+        except exceptions.FileNotTrackedError:
+            pass
+
+        self.assert_false(session_tracker.get_tracked()[TEST_FILE_2]['committed'])
+        os.remove(session_tracker._tracker_file)
+
+
 class TestCommit(bupytest.UnitTest):
     def __init__(self):
         super().__init__()
@@ -175,19 +267,98 @@ class TestCommit(bupytest.UnitTest):
         self.assert_expected(
             value=file_1_object_lines,
             expected={
-                1: 'This is a test!\n',
-                2: 'A big test!'
+                'hunks': [(1, 1, ['This is a test!\n', 'A big test!'])]
             }
         )
 
-        # "None" is a deleted line
+        # the difference is larger than the file, so a full copy is stored
         self.assert_expected(
             value=file_2_object_lines,
             expected={
-                1: None
+                'lines': ['Hello Word!\n']
             }
         )
 
+    def test_find_commits(self):
+        commit_ids = list(_commit.get_commits())
+        found = [commit_id for commit_id, __ in _commit.find_commits(author='author')]
+
+        self.assert_expected(found, commit_ids[::-1])
+        self.assert_expected(list(_commit.find_commits(author='author', email='other')), [])
+
+        newest = [commit_id for commit_id, __ in _commit.find_commits(limit=1)]
+        oldest = [commit_id for commit_id, __ in _commit.find_commits(author='author', skip=1, limit=5)]
+        self.assert_expected(newest, commit_ids[-1:])
+        self.assert_expected(oldest, commit_ids[:1])
+
+    def test_file_history(self):
+        file_commits = _commit._get_file_commits(TEST_FILE_1)
+        expected = [(commit_id, cdata['objects'][TEST_FILE_1]) for commit_id, cdata in file_commits.items()]
+
+        self.assert_expected(_commit._get_file_objects(TEST_FILE_1), expected)
+
+        # commits not indexed are read from the commit log, and
+        # the index is only written again by the next commit
+        shutil.rmtree(os.path.join(REPO_DIR, 'file-history'))
+        self.assert_expected(commit.Commit()._get_file_objects(TEST_FILE_1), expected)
+
+        found = [commit_id for commit_id, __ in _commit.find_commits(filepath=TEST_FILE_1)]
+        self.assert_expected(found, list(file_commits)[::-1])
+        self.assert_false(os.path.exists(os.path.join(REPO_DIR, 'file-history')))
+
+
+class TestCommitIndex(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._repo_dir = tempfile.mkdtemp()
+        self._commit_log = journal.CommitLog(self._repo_dir)
+        self._commit_index = history.CommitIndex(self._repo_dir)
+
+        commits = [
+            ('ana', 'ana@mail', '2023-01-10 10:00:00'),
+            ('bob', 'bob@mail', '2023-01-10 18:30:00'),
+            ('ana', 'ana@work', '2023-02-01 09:00:00'),
+            ('bob', 'bob@mail', '2023-03-15 12:00:00'),
+        ]
+
+        for number, (author, email, date) in enumerate(commits):
+            commit_data = dict(author=author, author_email=email, message='', date=date, objects={})
+            self._commit_log.append(f'commit{number}', commit_data)
+
+    def test_find(self):
+        self._commit_index.update(self._commit_log)
+
+        def find(*args, **kwargs) -> list:
+            return list(self._commit_index.find(*args, **kwargs))
+
+        self.assert_expected(len(self._commit_index), 4)
+        self.assert_expected(find(author='ana'), [0, 2])
+        self.assert_expected(find(email='bob@mail'), [1, 3])
+        self.assert_expected(find(author='ana', email='ana@work'), [2])
+        self.assert_expected(find(author='nobody'), [])
+        since, until = history.get_date_range(date='2023-01-10')
+        self.assert_expected(find(since=since, until=until), [0, 1])
+        self.assert_expected(find(since=history.get_date_key('2023-01-10 12:00:00')), [1, 2, 3])
+        self.assert_expected(find('bob', since=history.get_date_key('2023-02-01')), [3])
+        self.assert_expected(find(until=history.get_date_key('2023-01-31', end=True)), [0, 1])
+
+    def test_unsorted_dates(self):
+        commit_data = dict(author='ana', author_email='ana@mail', message='', date='2022-12-31 23:00:00', objects={})
+        self._commit_log.append('commit4', commit_data)
+        until = history.get_date_key('2023-01-10', end=True)
+
+        # commits not indexed yet are found without writing the index
+        self.assert_expected(list(self._commit_index.find(until=until, commit_log=self._commit_log)), [0, 1, 4])
+        self.assert_expected(self._commit_index.find('ana', 'ana@mail', commit_log=self._commit_log), [0, 4])
+        self.assert_expected(len(self._commit_index), 4)
+
+        self._commit_index.update(self._commit_log)
+
+        self.assert_expected(list(self._commit_index.find(until=until)), [0, 1, 4])
+        self.assert_expected(self._commit_index.find('ana', 'ana@mail'), [0, 4])
+        shutil.rmtree(self._repo_dir)
+
 
 class TestIntegrity(bupytest.UnitTest):
     def __init__(self):
@@ -216,13 +387,834 @@ class TestIntegrity(bupytest.UnitTest):
         with open(file_1_object_path, 'wb') as obj:
             obj.write(original_content)
 
-    def test_commit_data_change_detect(self):
+    def test_checkpoint(self):
+        self.assert_true(_commit.check_integrity(full=True))
+
+        with open(os.path.join(REPO_DIR, 'integrity.json')) as file:
+            checkpoint = json.load(file)
+
         commits = _commit.get_commits()
-        last_commit = list(commits.keys())[-1]
+        self.assert_expected(checkpoint['position'], len(commits))
 
-        commits[last_commit]['author'] = 'Anonymous User'
-        
-        with open(os.path.join(REPO_DIR, 'commits.json'), 'w') as file:
-            json.dump(commits, file)
+        # objects of commits before the checkpoint are still verified
+        first_commit = list(commits.values())[0]
+        object_path = os.path.join(OBJECT_DIR, first_commit['objects'][TEST_FILE_1])
+
+        with open(object_path, 'rb') as obj:
+            original_content = obj.read()
+
+        with open(object_path, 'wb') as obj:
+            obj.write(b'changed content')
 
         self.assert_false(_commit.check_integrity())
+
+        with open(object_path, 'wb') as obj:
+            obj.write(original_content)
+
+        self.assert_true(_commit.check_integrity())
+
+    def test_audit(self):
+        commits = _commit.get_commits()
+        report = _commit.audit(jobs=2)
+
+        self.assert_true(report.valid)
+        self.assert_expected(report.commits, len(commits))
+        self.assert_true(report.size > 0)
+
+        first_commit_id, first_commit = list(commits.items())[0]
+        object_id = first_commit['objects'][TEST_FILE_2]
+        object_path = os.path.join(OBJECT_DIR, object_id)
+
+        with open(object_path, 'rb') as obj:
+            original_content = obj.read()
+
+        with open(object_path, 'wb') as obj:
+            obj.write(b'changed content')
+
+        report = _commit.audit(jobs=2)
+
+        self.assert_false(report.valid)
+        self.assert_expected(report.broken_commit, first_commit_id)
+        self.assert_expected(report.broken_object, object_id)
+
+        with open(object_path, 'wb') as obj:
+            obj.write(original_content)
+
+    def test_commit_data_change_detect(self):
+        commit_log = os.path.join(REPO_DIR, 'commits.log')
+
+        with open(commit_log) as file:
+            records = file.readlines()
+
+        last_commit_id, last_commit = json.loads(records[-1])
+        last_commit['author'] = 'Anonymous User'
+        records[-1] = json.dumps([last_commit_id, last_commit]) + '\n'
+
+        with open(commit_log, 'w') as file:
+            file.writelines(records)
+
+        self.assert_false(commit.Commit().check_integrity())
+
+        report = commit.Commit().audit()
+        self.assert_expected(report.broken_commit, last_commit_id)
+        self.assert_expected(report.broken_object, None)
+
+
+class TestIndex(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._index = index.Index()
+        self._index_file = os.path.join(REPO_DIR, 'index.json')
+
+    def test_cache_file_hash(self):
+        os.utime(TEST_FILE_1, ns=(0, 0))
+        file_hash = self._index.file_hash(TEST_FILE_1)
+        self._index.save()
+
+        with open(self._index_file) as file:
+            entries = json.load(file)
+
+        self.assert_expected(file_hash, tracker.Tracker.get_file_hash(TEST_FILE_1))
+        self.assert_expected(entries[TEST_FILE_1][4], file_hash, message='File hash not cached')
+
+    def test_racy_file_not_cached(self):
+        with open(TEST_FILE_2, 'w') as file:
+            file.write(TEST_FILE_2_CONTENT)
+
+        file_hash = self._index.file_hash(TEST_FILE_2)
+        self._index.save()
+
+        with open(self._index_file) as file:
+            entries = json.load(file)
+
+        self.assert_expected(file_hash, tracker.Tracker.get_file_hash(TEST_FILE_2))
+        self.assert_false(entries.get(TEST_FILE_2), message='Racily clean file was cached')
+
+    def test_changed_file_rehashed(self):
+        with open(TEST_FILE_1, 'w') as file:
+            file.write(TEST_FILE_1_CONTENT)
+
+        os.utime(TEST_FILE_1, ns=(0, 0))
+        file_hash = self._index.file_hash(TEST_FILE_1)
+
+        self.assert_expected(file_hash, tracker.Tracker.get_file_hash(TEST_FILE_1))
+
+
+class TestUtils(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+    def test_hash_file(self):
+        filepath = os.path.join(FILE_TESTS_DIR, 'large.bin')
+        content = os.urandom(utils.HASH_BUFFER_SIZE * 2 + 123)
+
+        with open(filepath, 'wb') as file:
+            file.write(content)
+
+        self.assert_expected(utils.hash_file(filepath).hexdigest(), hashlib.md5(content).hexdigest())
+        self.assert_expected(utils.hash_file(filepath, hashlib.sha1).digest(), hashlib.sha1(content).digest())
+        os.remove(filepath)
+
+    def test_parallel_map(self):
+        items = [f'item {number}' for number in range(50)]
+        self.assert_expected(utils.parallel_map(len, items, jobs=2), [len(i) for i in items])
+
+    def test_parallel_hashing(self):
+        files = [os.path.join(FILE_TESTS_DIR, f'parallel{number}.txt') for number in range(12)]
+
+        for number, filepath in enumerate(files):
+            with open(filepath, 'w') as file:
+                file.write(f'file {number}\n' * (number + 1))
+
+        hashes = {jobs: index.Index().file_hashes(files, jobs=jobs) for jobs in (1, 2)}
+        tracked = {}
+
+        for jobs in (1, 2):
+            jobs_tracker = tracker.Tracker()
+            jobs_tracker._tracker_file = os.path.join(FILE_TESTS_DIR, f'tracker{jobs}.json')
+            jobs_tracker.track(files, jobs=jobs)
+            tracked[jobs] = jobs_tracker.get_tracked()
+            os.remove(jobs_tracker._tracker_file)
+
+        for filepath in files:
+            os.remove(filepath)
+
+        self.assert_expected(list(hashes[2].items()), list(hashes[1].items()), message='Parallel hashes differ')
+        self.assert_expected(list(hashes[1]), files, message='Order of files not kept')
+        self.assert_expected(list(tracked[2].items()), list(tracked[1].items()), message='Parallel tracking differs')
+        self.assert_expected(list(tracked[1]), files, message='Order of files not kept')
+
+
+class TestDiff(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._lines = [f'line {number}\n' for number in range(100)]
+
+    def test_insert_line(self):
+        new_lines = ['first line\n'] + self._lines
+        hunks = diff.diff_lines(self._lines, new_lines)
+
+        self.assert_expected(hunks, [(0, 0, ['first line\n'])])
+        self.assert_expected(diff.patch_lines(self._lines, hunks), new_lines)
+
+    def test_patch_lines(self):
+        new_lines = list(self._lines)
+        del new_lines[10:15]
+        new_lines[50] = 'changed line\n'
+        new_lines.insert(80, 'new line\n')
+        new_lines.append('last line\n')
+
+        for max_cost in (diff.MAX_EDIT_COST, 2):
+            hunks = diff.diff_lines(self._lines, new_lines, max_cost)
+            self.assert_expected(diff.patch_lines(self._lines, hunks), new_lines)
+
+        hunks = diff.diff_lines(self._lines, new_lines)
+        self.assert_expected(sum(deleted + len(inserted) for __, deleted, inserted in hunks), 9)
+
+    def test_replaced_lines(self):
+        new_lines = list(self._lines)
+        new_lines[10] = 'changed line\n'
+        new_lines[11] = 'changed line\n'
+        new_lines[60] = 'other line\n'
+
+        hunks = diff.diff_lines(self._lines, new_lines)
+        self.assert_expected(hunks, [(10, 2, ['changed line\n'] * 2), (60, 1, ['other line\n'])])
+
+        # changes needing more edits than the limit are replaced at once
+        new_lines = [line.upper() for line in self._lines] + ['last line\n']
+        self.assert_expected(diff.diff_lines(self._lines, new_lines, max_cost=100), [(0, 100, new_lines)])
+
+    def test_merge_legacy_objects(self):
+        objects = [
+            {0: 'a\n', 1: 'b\n', 2: 'c\n'},
+            {1: 'x\n', 2: None},
+            {'hunks': [(0, 0, ['new\n'])]}
+        ]
+
+        self.assert_expected(commit.Commit._merge_lines(objects[:2]), ['a\n', 'x\n'])
+        self.assert_expected(commit.Commit._merge_lines(objects), ['new\n', 'a\n', 'x\n'])
+
+
+class TestIgnore(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+    def test_patterns(self):
+        matcher = ignore.IgnoreMatcher(['*.pyc', 'build/', '/docs/*.md', '!docs/index.md', 'lib/**/test'])
+
+        self.assert_true(matcher.is_ignored('src/module.pyc'))
+        self.assert_true(matcher.is_ignored('src/build', is_dir=True))
+        self.assert_false(matcher.is_ignored('src/build'), message='Directory pattern matched a file')
+        self.assert_true(matcher.is_ignored('docs/usage.md'))
+        self.assert_false(matcher.is_ignored('docs/index.md'), message='Negated pattern ignored')
+        self.assert_false(matcher.is_ignored('src/docs/usage.md'), message='Anchored pattern matched a subdirectory')
+        self.assert_true(matcher.is_ignored('lib/a/b/test', is_dir=True))
+
+    def test_prune_ignored_dirs(self):
+        workdir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(workdir)
+
+        try:
+            for filepath in ('main.py', 'main.pyc', 'src/app.py', 'node_modules/pkg/index.js', '.box/index.json'):
+                os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+                open(filepath, 'w').close()
+
+            with open(ignore.IGNORE_FILE, 'w') as ignore_file:
+                ignore_file.write('# dependencies\nnode_modules/\n*.pyc\n')
+
+            non_ignored = sorted(ignore.get_non_ignored())
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+
+        self.assert_expected(non_ignored, ['.ignore', 'main.py', 'src/app.py'])
+
+    def test_scan_stat_once(self):
+        workdir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(workdir)
+
+        try:
+            os.makedirs('src/module')
+
+            for filepath in ('main.py', 'src/app.py', 'src/module/core.py'):
+                with open(filepath, 'w') as file:
+                    file.write(filepath)
+
+            files = ignore.scan()
+            stat = os.stat
+
+            with utils.count_syscalls():
+                stats_before = utils.SYSCALLS['os.stat']
+                main_stat = files.stat('main.py')
+                cached_stat = files.stat('main.py')
+                stats = utils.SYSCALLS['os.stat'] - stats_before
+
+            self.assert_true(os.stat is stat, message='os.stat not restored')
+            self.assert_expected(list(files), ['main.py', 'src/app.py', 'src/module/core.py'])
+            self.assert_expected(main_stat.st_size, len('main.py'))
+            self.assert_true(cached_stat is main_stat)
+            self.assert_expected(stats, 1)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+
+
+class TestUntracked(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self.non_ignored = [
+            'README.md', 'src/main.py', 'src/new.py', 'src/lib/util.py',
+            'src/lib/deep/core.py', 'docs/a/b/guide.md', 'docs/a/b/faq.md', 'tests/test_main.py'
+        ]
+
+        self.tracked = {'README.md': {}, 'src/main.py': {}, 'src/lib/util.py': {}}
+
+    def test_collapse_untracked_dirs(self):
+        untracked = cli._get_untracked_files(self.non_ignored, self.tracked)
+
+        # only directories without tracked files are collapsed, nested or not
+        self.assert_expected(untracked, (
+            'src/lib/deep/', 'docs/a/b/', 'tests/', 'src/new.py'
+        ))
+
+    def test_untracked_files(self):
+        untracked = cli._get_untracked_files(self.non_ignored, self.tracked, collapse_dirs=False)
+
+        self.assert_expected(untracked, (
+            'src/new.py', 'src/lib/deep/core.py', 'docs/a/b/guide.md',
+            'docs/a/b/faq.md', 'tests/test_main.py'
+        ))
+
+    def test_all_tracked(self):
+        tracked = dict.fromkeys(self.non_ignored)
+        self.assert_expected(cli._get_untracked_files(self.non_ignored, tracked), ())
+
+
+class TestSnapshot(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._filepath = os.path.join(FILE_TESTS_DIR, 'snapshot.txt')
+        self._lines = [f'line {i}\n' for i in range(10)]
+
+    def test_merge_from_snapshot(self):
+        with open(self._filepath, 'w') as file:
+            file.writelines(self._lines)
+
+        _tracker.track([self._filepath])
+
+        for number in range(commit.SNAPSHOT_INTERVAL + 5):
+            self._lines[number % 10] = f'line changed in commit {number}\n'
+
+            with open(self._filepath, 'w') as file:
+                file.writelines(self._lines)
+
+            _commit.commit('author', 'email', [self._filepath], message=f'commit {number}')
+
+        snapshot = _tracker.get_tracked_file(self._filepath)['snapshot']
+
+        self.assert_true(snapshot > 0, message='No snapshot created')
+        self.assert_expected(commit.Commit().merge_objects(self._filepath), self._lines)
+        self.assert_expected(commit.Commit().merge_objects(self._filepath, 0), self._lines)
+
+
+class TestMergeCache(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+    def test_lru_eviction(self):
+        merged = ['a' * 100]
+        merge_cache = cache.MergeCache(max_size=300)
+
+        merge_cache.set('file1', 'commit1', merged)
+        merge_cache.set('file2', 'commit1', merged)
+        merge_cache.get('file1', 'commit1')
+        merge_cache.set('file3', 'commit1', merged)
+
+        self.assert_expected(merge_cache.get('file1', 'commit1'), merged)
+        self.assert_expected(merge_cache.get('file2', 'commit1'), None, message='Least recently used not evicted')
+        self.assert_expected(merge_cache.get('file3', 'commit1'), merged)
+
+    def test_persisted_cache(self):
+        merged = ['a\n', 'b\n']
+        cache.MergeCache(persist=True).set('file1', 'commit1', merged)
+        merge_cache = cache.MergeCache(persist=True)
+
+        self.assert_expected(merge_cache.get('file1', 'commit1'), merged)
+        self.assert_expected(merge_cache.get('file1', 'commit2'), None, message='Cache of other commit returned')
+
+
+class TestObjects(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+    def test_deduplicate_objects(self):
+        copies = [os.path.join(FILE_TESTS_DIR, f'copy{i}.txt') for i in range(2)]
+
+        for filepath in copies:
+            with open(filepath, 'w') as file:
+                file.write(TEST_FILE_1_CONTENT)
+
+        _tracker.track(copies)
+        commit_id = _commit.commit('author', 'email', copies, message='copies')
+        objects = _commit.get_commits()[commit_id]['objects']
+        object_id = objects[copies[0]]
+
+        with open(os.path.join(OBJECT_DIR, object_id), 'rb') as object_file:
+            object_hash = hashlib.sha1(object_file.read()).hexdigest()
+
+        self.assert_expected(objects[copies[1]], object_id, message='Duplicated object stored')
+        self.assert_expected(object_id, object_hash, message='Object ID is not the content hash')
+
+    def test_batch_durability(self):
+        store = objects.ObjectStore(OBJECT_DIR, durability='batch')
+        content = b'batch object content'
+        object_id = store.write(content)
+        object_path = os.path.join(OBJECT_DIR, object_id)
+
+        # objects of a batch are not visible before they are synced
+        self.assert_false(os.path.isfile(object_path), message='Object renamed before sync')
+        self.assert_true(store.exists(object_id))
+        self.assert_expected(store.read(object_id), content)
+
+        store.sync()
+
+        self.assert_true(os.path.isfile(object_path), message='Object not renamed by sync')
+        self.assert_expected(objects.ObjectStore(OBJECT_DIR).read(object_id), content)
+        self.assert_false(any(f.endswith('.tmp') for f in os.listdir(OBJECT_DIR)))
+
+        discarded_id = store.write(b'discarded content')
+        store.discard()
+
+        self.assert_false(store.exists(discarded_id), message='Discarded object exists')
+        self.assert_false(any(f.endswith('.tmp') for f in os.listdir(OBJECT_DIR)))
+
+        os.remove(object_path)
+
+    def test_atomic_write(self):
+        filepath = os.path.join(FILE_TESTS_DIR, 'atomic.json')
+
+        for durability in atomic.DURABILITY_MODES:
+            atomic.atomic_write(filepath, durability, durability)
+
+            with open(filepath) as file:
+                self.assert_expected(file.read(), durability)
+
+        self.assert_false(os.path.exists(atomic.get_temp_path(filepath)), message='Temporary file not removed')
+        os.remove(filepath)
+
+    def test_compressed_objects(self):
+        compressible = b'compressible content\n' * 100
+        incompressible = os.urandom(1024)
+
+        for codec in ('zlib', 'lzma'):
+            store = objects.ObjectStore(OBJECT_DIR, compression=codec)
+            object_id = store.write(compressible)
+            raw_object_id = store.write(incompressible)
+
+            with open(os.path.join(OBJECT_DIR, object_id), 'rb') as object_file:
+                stored = object_file.read()
+
+            self.assert_true(stored.startswith(objects.OBJECT_MAGIC), message='Object not compressed')
+            self.assert_true(len(stored) < len(compressible), message='Compressed object is larger')
+            self.assert_expected(store.read(object_id), compressible)
+            self.assert_expected(objects.ObjectStore(OBJECT_DIR).read(raw_object_id), incompressible)
+
+            os.remove(os.path.join(OBJECT_DIR, object_id))
+            os.remove(os.path.join(OBJECT_DIR, raw_object_id))
+
+    def test_packed_objects(self):
+        packs_dir = tempfile.mkdtemp()
+        objects_dir = os.path.join(packs_dir, 'objects')
+        os.mkdir(objects_dir)
+
+        store = objects.ObjectStore(objects_dir)
+        contents = [os.urandom(100) for __ in range(20)]
+        object_ids = [store.write(content) for content in contents]
+
+        self.assert_expected(store.pack(), 20, message='Loose objects not packed')
+        self.assert_expected(os.listdir(objects_dir), [], message='Loose objects not removed')
+
+        store = objects.ObjectStore(objects_dir)
+        store.write(b'loose object')
+
+        for object_id, content in zip(object_ids, contents):
+            self.assert_true(store.exists(object_id))
+            self.assert_expected(store.read(object_id), content)
+            self.assert_expected(store.get_hash(object_id), hashlib.md5(content).digest())
+
+        self.assert_expected(store.pack(), 1)
+        self.assert_expected(len(os.listdir(os.path.join(packs_dir, 'packs'))), 4, message='Old pack not kept')
+        self.assert_expected(store.read(hashlib.sha1(b'loose object').hexdigest()), b'loose object')
+        self.assert_expected(store.read(object_ids[0]), contents[0])
+
+        # a loose copy of a packed object is removed without a new pack
+        with open(os.path.join(objects_dir, object_ids[0]), 'wb') as _object:
+            _object.write(contents[0])
+
+        self.assert_expected(store.pack(), 1)
+        self.assert_expected(len(os.listdir(os.path.join(packs_dir, 'packs'))), 4)
+        self.assert_expected(os.listdir(objects_dir), [])
+        self.assert_false(store.exists(hashlib.sha1(b'missing').hexdigest()))
+        shutil.rmtree(packs_dir)
+
+    def test_packed_empty_object(self):
+        packs_dir = tempfile.mkdtemp()
+        objects_dir = os.path.join(packs_dir, 'objects')
+        os.mkdir(objects_dir)
+
+        store = objects.ObjectStore(objects_dir)
+        object_id = store.write(b'')
+
+        self.assert_expected(store.pack(), 1)
+        self.assert_expected(os.listdir(objects_dir), [])
+
+        store = objects.ObjectStore(objects_dir)
+        self.assert_true(store.exists(object_id))
+        self.assert_expected(store.read(object_id), b'')
+        self.assert_expected(store.get_hash(object_id), hashlib.md5(b'').digest())
+        self.assert_false(store.exists(hashlib.sha1(b'missing').hexdigest()))
+        shutil.rmtree(packs_dir)
+
+    def test_delta_objects(self):
+        objects_dir = tempfile.mkdtemp()
+        store = objects.ObjectStore(objects_dir, delta_depth=2)
+        filepath = os.path.join(FILE_TESTS_DIR, 'asset.bin')
+        content = bytearray(os.urandom(64 * 1024))
+        object_ids = []
+
+        for version in range(4):
+            content[version * 1000:version * 1000 + 100] = os.urandom(100)
+
+            with open(filepath, 'wb') as file:
+                file.write(content)
+
+            object_ids.append(store.write_file(filepath, object_ids[-1] if object_ids else None))
+            self.assert_expected(store.read(object_ids[-1]), bytes(content))
+
+        # the chain ends after two deltas
+        depths = [store.get_delta_depth(object_id) for object_id in object_ids]
+        self.assert_expected(depths, [0, 1, 2, 0])
+        self.assert_true(os.path.getsize(os.path.join(objects_dir, object_ids[1])) < 1024)
+
+        with open(filepath, 'wb') as file:
+            file.write(os.urandom(64 * 1024))
+
+        # unrelated content is stored in full
+        object_id = store.write_file(filepath, object_ids[-1])
+        self.assert_expected(store.get_delta_depth(object_id), 0)
+        self.assert_expected(objects.create_delta(bytes(content), os.urandom(64 * 1024), 32 * 1024), None)
+
+        self.assert_expected(store.pack(), 5)
+        self.assert_expected(store.read(object_ids[2]), objects.ObjectStore(objects_dir).read(object_ids[2]))
+        os.remove(filepath)
+        shutil.rmtree(objects_dir)
+
+    def test_migrate_delta_base(self):
+        objects_dir = os.path.join(tempfile.mkdtemp(), 'objects')
+        os.mkdir(objects_dir)
+        store = objects.ObjectStore(objects_dir)
+        filepath = os.path.join(FILE_TESTS_DIR, 'asset.bin')
+        base = os.urandom(64 * 1024)
+        content = base[:1000] + os.urandom(100) + base[1100:]
+
+        # object with a random ID, created before objects were content-addressed
+        legacy_id = hashlib.sha1(b'legacy object').hexdigest()
+        with open(os.path.join(objects_dir, legacy_id), 'wb') as _object:
+            _object.write(base)
+
+        with open(filepath, 'wb') as file:
+            file.write(content)
+
+        object_id = store.write_file(filepath, legacy_id)
+        self.assert_expected(store.get_delta_base(object_id), None)
+
+        # delta over the random ID, as written by earlier versions
+        os.remove(os.path.join(objects_dir, object_id))
+        with open(os.path.join(objects_dir, object_id), 'wb') as _object:
+            _object.write(objects._make_delta_header(len(content), legacy_id, 1) + objects.create_delta(base, content))
+
+        migrated = store.migrate([legacy_id, object_id])
+        store.remove_migrated(migrated)
+
+        self.assert_expected(migrated[legacy_id], hashlib.sha1(base).hexdigest())
+        self.assert_expected(store.read(object_id), content)
+        self.assert_expected(store.read(migrated[legacy_id]), base)
+        os.remove(filepath)
+        shutil.rmtree(os.path.dirname(objects_dir))
+
+    def test_migrate_packed_objects(self):
+        objects_dir = os.path.join(tempfile.mkdtemp(), 'objects')
+        os.mkdir(objects_dir)
+        store = objects.ObjectStore(objects_dir, compression='zlib')
+        contents = [b'legacy object', b'compressed legacy object' * 10]
+
+        # objects with random IDs, packed before they were migrated
+        legacy_ids = [hashlib.sha1(f'legacy {number}'.encode()).hexdigest() for number in range(2)]
+
+        with open(os.path.join(objects_dir, legacy_ids[0]), 'wb') as _object:
+            _object.write(contents[0])
+
+        object_id = store.write(contents[1])
+        os.replace(os.path.join(objects_dir, object_id), os.path.join(objects_dir, legacy_ids[1]))
+
+        self.assert_expected(store.pack(), 2)
+        stored_hashes = [store.get_hash(legacy_id) for legacy_id in legacy_ids]
+
+        migrated = store.migrate(legacy_ids)
+        store.remove_migrated(migrated)
+        new_ids = [migrated[legacy_id] for legacy_id in legacy_ids]
+
+        self.assert_expected(new_ids, [hashlib.sha1(content).hexdigest() for content in contents])
+        self.assert_expected([store.read(new_id) for new_id in new_ids], contents)
+        self.assert_expected([store.get_hash(new_id) for new_id in new_ids], stored_hashes)
+        self.assert_expected(sorted(os.listdir(objects_dir)), sorted(new_ids))
+        shutil.rmtree(os.path.dirname(objects_dir))
+
+
+class TestCommitLog(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._repo_dir = tempfile.mkdtemp()
+        self._commits = {f'commit{i}': {'message': f'message {i}\nline 2'} for i in range(5)}
+
+    def test_append(self):
+        commit_log = journal.CommitLog(self._repo_dir)
+
+        for commit_id, commit_data in self._commits.items():
+            commit_log.append(commit_id, commit_data)
+
+        self.assert_expected(len(commit_log), 5)
+        self.assert_expected(dict(commit_log), self._commits)
+        self.assert_expected(commit_log.last(), ('commit4', self._commits['commit4']))
+        self.assert_expected(commit_log.read_at(1), ('commit1', self._commits['commit1']))
+        self.assert_expected([cid for cid, __ in commit_log.iter_reversed()], list(reversed(self._commits)))
+
+    def test_recover_partial_record(self):
+        with open(os.path.join(self._repo_dir, 'commits.log'), 'ab') as log:
+            log.write(b'["commit5",{"mess')
+
+        commit_log = journal.CommitLog(self._repo_dir)
+        commit_log.append('commit6', {'message': 'message 6'})
+
+        self.assert_expected(len(commit_log), 6)
+        self.assert_expected(commit_log.last(), ('commit6', {'message': 'message 6'}))
+        self.assert_expected(commit_log.read_at(4), ('commit4', self._commits['commit4']))
+
+    def test_write_all_interrupted(self):
+        commit_log = journal.CommitLog(self._repo_dir)
+        commits = dict(commit_log)
+        commits['commit7'] = {'message': 'message 7'}
+        commit_log.write_all(commits)
+
+        self.assert_expected(dict(commit_log), commits)
+        self.assert_false(any(name.endswith('.tmp') for name in os.listdir(self._repo_dir)))
+
+        # stopped after the log was replaced, before its offsets
+        os.remove(os.path.join(self._repo_dir, 'commits.idx'))
+        commit_log = journal.CommitLog(self._repo_dir)
+
+        self.assert_expected(len(commit_log), 7)
+        self.assert_expected(commit_log.last(), ('commit7', {'message': 'message 7'}))
+        shutil.rmtree(self._repo_dir)
+
+
+class TestParallelCommit(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def _commit_versions(jobs: int, durability: str = 'batch') -> tuple:
+        workdir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        os.makedirs(os.path.join('.box', 'objects'))
+
+        try:
+            files = [f'text{number}.txt' for number in range(6)] + ['copy.txt', 'data.bin']
+            _tracker = tracker.Tracker()
+            commits_objects = []
+
+            for version in range(3):
+                for number, filepath in enumerate(files[:6]):
+                    with open(filepath, 'w') as file:
+                        file.writelines(f'line {line}, version {version * (line % 3 == number % 2)}\n' for line in range(50))
+
+                shutil.copyfile(files[0], 'copy.txt')
+
+                with open('data.bin', 'wb') as file:
+                    file.write(bytes(range(256)) * 64 + bytes([version]) * 100)
+
+                if not version:
+                    _tracker.track(files)
+
+                with _tracker.session():
+                    _commit = commit.Commit(_tracker, durability)
+                    commit_id = _commit.commit('author', 'email', files, f'version {version}', jobs=jobs)
+                    commits_objects.append(_commit.get_commits()[commit_id]['objects'])
+
+            stored = {}
+
+            for object_id in os.listdir(OBJECT_DIR):
+                with open(os.path.join(OBJECT_DIR, object_id), 'rb') as object_file:
+                    stored[object_id] = object_file.read()
+
+            return commits_objects, stored, _tracker.get_tracked()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+
+    def test_same_objects_as_serial(self):
+        serial = self._commit_versions(jobs=1)
+
+        for durability in atomic.DURABILITY_MODES:
+            parallel = self._commit_versions(jobs=4, durability=durability)
+
+            self.assert_expected(parallel[0], serial[0], message='Commit objects differ')
+            self.assert_expected(parallel[1], serial[1], message='Stored objects differ')
+            self.assert_expected(parallel[2], serial[2], message='Tracker information differs')
+
+
+def _commit_concurrently(number: int, commits: int) -> None:
+    repo_lock = lock.RepositoryLock(timeout=60)
+    filepath = f'file{number}.txt'
+
+    for commit_number in range(commits):
+        with open(filepath, 'w') as file:
+            file.write(f'file {number}, version {commit_number}\n')
+
+        with repo_lock.exclusive():
+            _tracker = tracker.Tracker()
+
+            with _tracker.session():
+                if not commit_number:
+                    _tracker.track([filepath])
+
+                commit.Commit(_tracker).commit('author', 'email', [filepath], f'{number}.{commit_number}')
+
+        # readers use the indexes while other processes commit
+        with repo_lock.shared():
+            reader = commit.Commit()
+            list(reader.find_commits(limit=5))
+            found = list(reader.find_commits(author='author', since='2000-01-01', filepath=filepath))
+            assert [data['message'] for __, data in found][::-1] == [f'{number}.{n}' for n in range(commit_number + 1)]
+
+
+def _read_concurrently(expected: list) -> None:
+    repo_lock = lock.RepositoryLock(timeout=60)
+
+    for __ in range(4):
+        with repo_lock.shared():
+            reader = commit.Commit()
+            found = [commit_id for commit_id, __ in reader.find_commits(author='author', since='2000-01-01', filepath='file0.txt')]
+            assert found == expected
+            assert [commit_id for commit_id, __ in reader._get_file_objects('file0.txt')] == expected[::-1]
+
+
+class TestLock(bupytest.UnitTest):
+    def __init__(self):
+        super().__init__()
+
+        self._repo_dir = tempfile.mkdtemp()
+
+    def test_shared_and_exclusive(self):
+        reader_1 = lock.RepositoryLock(self._repo_dir, timeout=0.05)
+        reader_2 = lock.RepositoryLock(self._repo_dir, timeout=0.05)
+        writer = lock.RepositoryLock(self._repo_dir, timeout=0.05)
+
+        with reader_1.shared(), reader_2.shared():
+            try:
+                writer.acquire(exclusive=True)
+            except exceptions.LockTimeoutError:
+                pass
+            else:
+                self.assert_true(False, message='Exclusive lock taken while shared')
+
+        with writer.exclusive():
+            try:
+                reader_1.acquire()
+            except exceptions.LockTimeoutError as error:
+                self.assert_true(str(os.getpid()) in str(error), message='Lock holder not reported')
+            else:
+                self.assert_true(False, message='Shared lock taken while exclusive')
+
+        with reader_1.shared():
+            pass
+
+    def test_stale_lock_recovery(self):
+        # a writer that crashed while holding the lock
+        with open(os.path.join(self._repo_dir, 'lock'), 'w') as lock_file:
+            lock_file.write('99999999')
+
+        temp_file = os.path.join(self._repo_dir, 'tracker.json.99999999.tmp')
+        open(temp_file, 'w').close()
+
+        with lock.RepositoryLock(self._repo_dir).exclusive():
+            self.assert_false(os.path.exists(temp_file), message='Stale temporary file not removed')
+
+        with open(os.path.join(self._repo_dir, 'lock')) as lock_file:
+            self.assert_expected(lock_file.read(), '')
+
+        shutil.rmtree(self._repo_dir)
+
+    def test_concurrent_commits(self):
+        workdir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        os.makedirs(os.path.join('.box', 'objects'))
+
+        processes_count, commits = 8, 4
+        context = multiprocessing.get_context('fork')
+
+        try:
+            processes = [
+                context.Process(target=_commit_concurrently, args=(number, commits))
+                for number in range(processes_count)
+            ]
+
+            for process in processes:
+                process.start()
+
+            for process in processes:
+                process.join()
+
+            self.assert_true(all(process.exitcode == 0 for process in processes), message='Process failed')
+
+            tracked = tracker.Tracker().get_tracked()
+            repo_commit = commit.Commit()
+
+            self.assert_expected(len(tracked), processes_count, message='Tracked files lost')
+            self.assert_true(all(info['committed'] for info in tracked.values()))
+            self.assert_expected(repo_commit.get_commits_count(), processes_count * commits)
+            self.assert_true(repo_commit.check_integrity(full=True), message='Commits broken')
+
+            # each commit is indexed once
+            self.assert_expected(len(history.CommitIndex()), processes_count * commits)
+            self.assert_expected(len(history.FileHistory()), processes_count * commits)
+            self.assert_expected(len(list(repo_commit.find_commits(since='2000-01-01'))), processes_count * commits)
+
+            # readers of stale indexes do not write them
+            expected = [commit_id for commit_id, __ in repo_commit.find_commits(filepath='file0.txt')]
+            shutil.rmtree(os.path.join('.box', 'commit-index'))
+            shutil.rmtree(os.path.join('.box', 'file-history'))
+
+            readers = [context.Process(target=_read_concurrently, args=(expected,)) for __ in range(processes_count)]
+
+            for process in readers:
+                process.start()
+
+            for process in readers:
+                process.join()
+
+            self.assert_true(all(process.exitcode == 0 for process in readers), message='Reader failed')
+            self.assert_false(os.path.exists(os.path.join('.box', 'commit-index')))
+            self.assert_false(os.path.exists(os.path.join('.box', 'file-history')))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)